@@ -5,7 +5,7 @@ with open("README.rst") as f:
 
 
 requires = [
-    "ijson>=2.5",
+    "ijson>=3.0",
     "jsonref",
     "jsonpointer",
     "xlsxwriter",
@@ -39,6 +39,8 @@ setup(
     extras_require={
         "test": test_requires,
         "docs": docs_requires,
+        "zstd": ["zstandard"],
+        "parquet": ["pyarrow"],
     },
     package_data={"spoonbill": ["locales/*/*/*.mo", "locales/*/*/*.po"]},
     include_package_data=True,
@@ -1,13 +1,34 @@
+import io
 import logging
 import pickle
+from collections import defaultdict
+from contextlib import ExitStack
+from dataclasses import replace
+from functools import partial
+from itertools import tee
 from pathlib import Path
 
-from spoonbill.common import COMBINED_TABLES, ROOT_TABLES, TABLE_THRESHOLD
+from spoonbill.common import COMBINED_TABLES, RELEASES_BATCH_SIZE, ROOT_TABLES, TABLE_THRESHOLD
+from spoonbill.filters import filter_releases
 from spoonbill.flatten import Flattener
 from spoonbill.i18n import LOCALE, _
+from spoonbill.remote import input_path, open_input
 from spoonbill.stats import DataPreprocessor
-from spoonbill.utils import iter_file
-from spoonbill.writers import CSVWriter, XlsxWriter
+from spoonbill.utils import iter_file, latest_releases, select_items
+from spoonbill.writers import (
+    BackgroundWriter,
+    ColumnStatsWriter,
+    CSVWriter,
+    HashPartitionedWriter,
+    ParallelXlsxWriter,
+    ParquetWriter,
+    PostgresCopyWriter,
+    SQLiteWriter,
+    XlsxWriter,
+)
+from spoonbill.writers.background import QUEUE_SIZE
+from spoonbill.writers.column_stats import STATS_FILENAME
+from spoonbill.writers.csv import MAX_OPEN_FILES
 
 LOGGER = logging.getLogger("spoonbill")
 
@@ -20,6 +41,8 @@ class FileAnalyzer:
     :param root_tables: Path configuration which should become root tables
     :param combined_tables: Path configuration for tables with multiple sources
     :param root_key: Field name to access records
+    :param dedup: Predicate to skip repeated releases, e.g. `ReleaseDeduplicator`
+    :param compiled: Analyze only compiled releases of records
     """
 
     def __init__(
@@ -32,6 +55,8 @@ class FileAnalyzer:
         root_key="releases",
         language=LOCALE,
         table_threshold=TABLE_THRESHOLD,
+        dedup=None,
+        compiled=False,
     ):
         self.workdir = Path(workdir)
         if state_file:
@@ -45,15 +70,19 @@ class FileAnalyzer:
                 table_threshold=table_threshold,
             )
         self.root_key = root_key
+        self.dedup = dedup
+        self.compiled = compiled
 
     def analyze_file(self, filename, with_preview=True):
         """Analyze provided file
-        :param filename: Input filename
+        :param filename: Input filename or http(s) url
         :param with_preview: Generate preview during analysis
         """
-        path = self.workdir / filename
-        with open(path, "rb") as fd:
-            items = iter_file(fd, self.root_key)
+        path = input_path(self.workdir, filename)
+        with open_input(path) as fd:
+            items = iter_file(fd, self.root_key, compiled=self.compiled)
+            if self.dedup:
+                items = filter_releases(items, self.dedup)
             for count in self.spec.process_items(items, with_preview=with_preview):
                 yield fd.tell(), count
 
@@ -75,51 +104,277 @@ class FileFlattener:
     :param root_key: Field name to access records
     :param csv: If True generate cvs files
     :param xlsx: Generate combined xlsx table
+    :param release_filter: Predicate to select releases to flatten, e.g. `ReleaseFilter`
+    :param dedup: Predicate to skip repeated releases, e.g. `ReleaseDeduplicator`
+    :param latest: Flatten only the most recent release for every ocid
+    :param compiled: Flatten only compiled releases of records
+    :param background: Write output in separate thread
+    :param queue_size: Maximum number of row batches waiting for background writer
+    :param batch_size: Number of releases flattened before rows are passed to writers
+    :param xlsx_workbook_rows: Continue xlsx output in new workbook after this number of rows
+    :param csv_compression: Compress csv files with `gzip`, `xz` or `zstd`
+    :param csv_max_rows: Split csv files into parts with this number of rows
+    :param csv_max_bytes: Split csv files into parts of this size in bytes
+    :param sqlite: Generate sqlite database with this filename
+    :param postgres: Directory for files in postgres COPY format
+    :param postgres_format: Postgres COPY format, `text` or `binary`
+    :param parquet: Directory for parquet files
+    :param buckets: Partition csv and parquet output into this number of buckets by ocid,
+        sqlite and postgres output is not partitioned
+    :param xlsx_workers: Render xlsx sheets in this number of processes, not combinable with `xlsx_workbook_rows`
+    :param column_stats: Write statistics of every output column to `stats.json` next to csv files
+    :param open_stream: Callable returning writable binary stream for output file name,
+        csv files, xlsx workbook and column statistics are written to returned streams instead of disk
+    :param in_memory: Keep csv files, xlsx workbook and column statistics in memory, available in `results`
+        as mapping between file name and `io.BytesIO` object once flattening is finished
     """
 
-    def __init__(self, workdir, options, tables, root_key="releases", csv=None, xlsx="result.xlsx", language=LOCALE):
+    def __init__(
+        self,
+        workdir,
+        options,
+        tables,
+        root_key="releases",
+        csv=None,
+        xlsx="result.xlsx",
+        language=LOCALE,
+        release_filter=None,
+        dedup=None,
+        latest=False,
+        compiled=False,
+        background=False,
+        queue_size=QUEUE_SIZE,
+        batch_size=RELEASES_BATCH_SIZE,
+        xlsx_workbook_rows=None,
+        xlsx_workers=None,
+        csv_compression=None,
+        csv_max_rows=None,
+        csv_max_bytes=None,
+        buckets=None,
+        sqlite=None,
+        postgres=None,
+        postgres_format="text",
+        parquet=None,
+        column_stats=False,
+        open_stream=None,
+        in_memory=False,
+    ):
         self.flattener = Flattener(options, tables, language=language)
+        self.source_tables = tables
         self.workdir = Path(workdir)
         # TODO: detect package, where?
         self.root_key = root_key
         self.writers = []
         self.csv = csv
         self.xlsx = xlsx
+        self.release_filter = release_filter
+        self.dedup = dedup
+        self.latest = latest
+        self.compiled = compiled
+        self.background = background
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.xlsx_workbook_rows = xlsx_workbook_rows
+        self.xlsx_workers = xlsx_workers
+        self.csv_compression = csv_compression
+        self.csv_max_rows = csv_max_rows
+        self.csv_max_bytes = csv_max_bytes
+        self.buckets = buckets
+        self.sqlite = sqlite
+        self.postgres = postgres
+        self.postgres_format = postgres_format
+        self.parquet = parquet
+        self.column_stats = column_stats
+        self.results = {}
+        self.open_stream = self._memory_stream if in_memory else open_stream
+        disk_only = (xlsx_workers, xlsx_workbook_rows, csv_max_rows, csv_max_bytes, buckets, sqlite, postgres, parquet)
+        if self.open_stream and any(disk_only):
+            raise ValueError(_("Output to streams supports only single csv files and single xlsx workbook"))
+        if xlsx_workers and xlsx_workbook_rows:
+            raise ValueError(_("Parallel xlsx output can't be split into multiple workbooks"))
+        self.writer_stats = None
+
+    def _memory_stream(self, filename):
+        return self.results.setdefault(filename, io.BytesIO())
+
+    def _iter_items(self, fd):
+        if self.latest:
+            if not fd.seekable():
+                raise ValueError(_("Selecting the latest releases requires input which could be read twice"))
+            # cheap first pass over ocid and date values only
+            latest = latest_releases(fd, self.root_key)
+            fd.seek(0)
+            items = select_items(iter_file(fd, self.root_key, compiled=self.compiled), latest)
+        else:
+            items = iter_file(fd, self.root_key, compiled=self.compiled)
+        if self.release_filter:
+            items = filter_releases(items, self.release_filter)
+        if self.dedup:
+            items = filter_releases(items, self.dedup)
+        return items
 
     def _flatten(self, filename, writers):
-        path = self.workdir / filename
-        with open(path, "rb") as fd:
-            items = iter_file(fd, self.root_key)
+        path = input_path(self.workdir, filename)
+        with open_input(path) as fd:
+            items = self._iter_items(fd)
+            batch = defaultdict(list)
             for count, data in self.flattener.flatten(items):
                 for table, rows in data.items():
-                    for row in rows:
-                        for wr in writers:
-                            wr.writerow(table, row)
+                    batch[table].extend(rows)
+                if count % self.batch_size == self.batch_size - 1:
+                    self._write(writers, batch)
+                    batch = defaultdict(list)
                 yield count
+            self._write(writers, batch)
 
-    def flatten_file(self, filename):
-        """Flatten file
+    def _write(self, writers, batch):
+        for table, rows in batch.items():
+            for wr in writers:
+                wr.writerows(table, rows)
 
-        :param filename: Input filename in working directory
-        """
+    def _open_writers(self, stack):
+        tables = self.flattener.tables
+        options = self.flattener.options
         workdir = self.workdir
         if isinstance(self.csv, Path):
             workdir = self.csv
-        if not self.xlsx and self.csv:
-            with CSVWriter(workdir, self.flattener.tables, self.flattener.options) as writer:
-                for count in self._flatten(filename, [writer]):
-                    yield count
-        if self.xlsx and not self.csv:
-            with XlsxWriter(self.workdir, self.flattener.tables, self.flattener.options, filename=self.xlsx) as writer:
-                for count in self._flatten(filename, [writer]):
-                    yield count
-
-        if self.xlsx and self.csv:
-            with XlsxWriter(
-                self.workdir, self.flattener.tables, self.flattener.options, filename=self.xlsx
-            ) as xlsx, CSVWriter(workdir, self.flattener.tables, self.flattener.options) as csv:
-                for count in self._flatten(filename, [xlsx, csv]):
-                    yield count
-
-
-__all__ = ["FileFlattener", "FileAnalyzer"]
+        writers = []
+        if self.xlsx and self.xlsx_workers:
+            xlsx = ParallelXlsxWriter(self.workdir, tables, options, filename=self.xlsx, workers=self.xlsx_workers)
+            writers.append(stack.enter_context(xlsx))
+        elif self.xlsx:
+            xlsx = XlsxWriter(
+                self.workdir,
+                tables,
+                options,
+                filename=self.xlsx,
+                max_workbook_rows=self.xlsx_workbook_rows,
+                stream=self.open_stream(self.xlsx) if self.open_stream else None,
+            )
+            writers.append(stack.enter_context(xlsx))
+        if self.csv:
+            factory = partial(
+                CSVWriter,
+                compression=self.csv_compression,
+                max_rows=self.csv_max_rows,
+                max_bytes=self.csv_max_bytes,
+                open_stream=self.open_stream,
+            )
+            if self.buckets:
+                factory = partial(factory, max_open=max(1, MAX_OPEN_FILES // self.buckets))
+                csv = HashPartitionedWriter(workdir, tables, options, self.buckets, factory=factory)
+            else:
+                csv = factory(workdir, tables, options)
+            writers.append(stack.enter_context(csv))
+        if self.sqlite:
+            writers.append(stack.enter_context(SQLiteWriter(self.workdir, tables, options, filename=self.sqlite)))
+        if self.postgres:
+            postgres = PostgresCopyWriter(Path(self.postgres), tables, options, format=self.postgres_format)
+            writers.append(stack.enter_context(postgres))
+        if self.parquet:
+            if self.buckets:
+                parquet = HashPartitionedWriter(
+                    Path(self.parquet), tables, options, self.buckets, factory=ParquetWriter
+                )
+            else:
+                parquet = ParquetWriter(Path(self.parquet), tables, options)
+            writers.append(stack.enter_context(parquet))
+        if self.column_stats:
+            stream = self.open_stream(STATS_FILENAME) if self.open_stream else None
+            writers.append(stack.enter_context(ColumnStatsWriter(workdir, tables, options, stream=stream)))
+        self.writers = writers
+        if self.background and writers:
+            writer = stack.enter_context(BackgroundWriter(writers, queue_size=self.queue_size))
+            self.writer_stats = writer.stats
+            writers = [writer]
+        return writers
+
+    def flatten_file(self, filename):
+        """Flatten file
+
+        :param filename: Input filename in working directory or http(s) url,
+            selecting the latest releases requires server supporting byte ranges
+        """
+        with ExitStack() as stack:
+            writers = self._open_writers(stack)
+            for count in self._flatten(filename, writers):
+                yield count
+
+
+def flatten_key(options):
+    """Part of flattening options which affects generated rows
+
+    Header related options like `pretty_headers`, `headers` and `name` are used only by writers,
+    so flatteners with the same flatten key produce the same rows.
+
+    :param options: Flattening options
+    """
+    selection = {
+        name: replace(config, pretty_headers=False, headers={}, name="") for name, config in options.selection.items()
+    }
+    return replace(options, selection=selection)
+
+
+class FanOutFlattener:
+    """Flatten single file into outputs of multiple flatteners with a single pass over input
+
+    Every flattener keeps its own options, language and writers. Flatteners created from the same tables
+    with options differing only in headers, e.g. human friendly or translated variants of the same export,
+    share generated rows, so rows of every such group are generated only once.
+    Input is read once with `root_key`, filters, `latest` and `compiled` settings of the first flattener.
+
+    :param workdir: Working directory
+    :param flatteners: List of `FileFlattener` objects
+    """
+
+    def __init__(self, workdir, flatteners):
+        if not flatteners:
+            raise ValueError(_("At least one flattener is required"))
+        self.workdir = Path(workdir)
+        self.flatteners = flatteners
+        # flatteners producing the same rows, the first one of every group generates them
+        self.groups = []
+        for flattener in flatteners:
+            key = (id(flattener.source_tables), flatten_key(flattener.flattener.options))
+            for group_key, group in self.groups:
+                if group_key == key:
+                    group.append(flattener)
+                    break
+            else:
+                self.groups.append((key, [flattener]))
+
+    def flatten_file(self, filename):
+        """Flatten file
+
+        :param filename: Input filename in working directory or http(s) url,
+            selecting the latest releases requires server supporting byte ranges
+        """
+        source = self.flatteners[0]
+        groups = [group for _key, group in self.groups]
+        batch_size = source.batch_size
+        path = input_path(self.workdir, filename)
+        with ExitStack() as stack:
+            writers = {id(flattener): flattener._open_writers(stack) for flattener in self.flatteners}
+            fd = stack.enter_context(open_input(path))
+            streams = tee(source._iter_items(fd), len(groups))
+            # flatteners advance together, so only the current item is kept in memory
+            results = zip(*[group[0].flattener.flatten(items) for group, items in zip(groups, streams)])
+            batches = [defaultdict(list) for _group in groups]
+            count = -1
+            for count, result in enumerate(results):
+                for batch, (_count, data) in zip(batches, result):
+                    for table, rows in data.items():
+                        batch[table].extend(rows)
+                if count % batch_size == batch_size - 1:
+                    self._write(groups, writers, batches)
+                    batches = [defaultdict(list) for _group in groups]
+                yield count
+            self._write(groups, writers, batches)
+
+    def _write(self, groups, writers, batches):
+        for group, batch in zip(groups, batches):
+            for flattener in group:
+                flattener._write(writers[id(flattener)], batch)
+
+
+__all__ = ["FanOutFlattener", "FileFlattener", "FileAnalyzer"]
@@ -0,0 +1,144 @@
+import asyncio
+from pathlib import Path
+
+from spoonbill.stream import StreamAnalyzer, StreamFlattener
+
+CHUNK_SIZE = 64 * 1024
+
+
+class aclosing:
+    """Async context manager closing async iterator on exit, `contextlib.aclosing` of python 3.10+
+
+    :param iterator: Async generator, e.g. returned by `AsyncFileFlattener.flatten_file`
+    """
+
+    def __init__(self, iterator):
+        self.iterator = iterator
+
+    async def __aenter__(self):
+        return self.iterator
+
+    async def __aexit__(self, *args):
+        await self.iterator.aclose()
+
+
+class AsyncReader:
+    """Base class reading input in chunks without blocking event loop
+
+    Input is either filename in working directory, read by `executor`, or async iterable of bytes,
+    e.g. body of HTTP request. Parsing and processing of every chunk runs in `executor`, so event loop
+    stays responsive and many conversions can share it. Every chunk is a cancellation point.
+
+    :param executor: Executor running file reads and processing, event loop default executor if not set.
+        Chunks are processed one at a time, so thread pool executor of any size could be shared.
+    :param chunk_size: Number of bytes read from file at once
+    """
+
+    def __init__(self, executor=None, chunk_size=CHUNK_SIZE):
+        self.executor = executor
+        self.chunk_size = chunk_size
+
+    def submit(self, func, *args):
+        """Schedule `func` in executor
+
+        :return: Future, call keeps running in executor if awaiting task is cancelled
+        """
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def run(self, func, *args):
+        """Run `func` in executor"""
+        return await self.submit(func, *args)
+
+    async def chunks(self, source, workdir):
+        """Iterate over chunks of `source`
+
+        :param source: Filename in `workdir` or async iterable of bytes
+        :param workdir: Working directory
+        """
+        if hasattr(source, "__aiter__"):
+            async for chunk in source:
+                yield chunk
+            return
+        fd = await self.run(open, Path(workdir) / source, "rb")
+        try:
+            while True:
+                chunk = await self.run(fd.read, self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            await self.run(fd.close)
+
+
+class AsyncFileAnalyzer(AsyncReader):
+    """asyncio counterpart of `FileAnalyzer.analyze_file`
+
+    :param analyzer: `FileAnalyzer` with analysis configuration, results are collected in its `spec`
+    :param with_preview: Generate preview during analysis
+    """
+
+    def __init__(self, analyzer, with_preview=True, executor=None, chunk_size=CHUNK_SIZE):
+        super().__init__(executor=executor, chunk_size=chunk_size)
+        self.analyzer = analyzer
+        self.with_preview = with_preview
+
+    async def analyze_file(self, source):
+        """Analyze input
+
+        :param source: Filename in working directory or async iterable of bytes
+        :return: Async iterator of number of bytes read and number of items analyzed so far
+        """
+        stream = StreamAnalyzer(self.analyzer, with_preview=self.with_preview)
+        read = 0
+        async for chunk in self.chunks(source, self.analyzer.workdir):
+            read += len(chunk)
+            yield read, await self.run(stream.feed, chunk)
+        yield read, await self.run(stream.close)
+
+
+class AsyncFileFlattener(AsyncReader):
+    """asyncio counterpart of `FileFlattener.flatten_file`
+
+    Writers of provided flattener are opened, fed and closed in executor.
+    When the iterator is closed, writers are closed with rows written so far, after the chunk being processed.
+    Cancelled consumer doesn't close async generator itself, so iterate within `aclosing`::
+
+        async with aclosing(AsyncFileFlattener(flattener).flatten_file(source)) as batches:
+            async for count, rows in batches:
+                ...
+
+    :param flattener: `FileFlattener` with flattening configuration and outputs
+    """
+
+    def __init__(self, flattener, executor=None, chunk_size=CHUNK_SIZE):
+        super().__init__(executor=executor, chunk_size=chunk_size)
+        self.flattener = flattener
+
+    async def flatten_file(self, source):
+        """Flatten input
+
+        :param source: Filename in working directory or async iterable of bytes
+        :return: Async iterator of number of flattened items so far and rows flattened from the last chunk
+            as mapping between table name and list of rows
+        """
+        stream = StreamFlattener(self.flattener)
+        # the last call in executor, shielded so it is not abandoned while still writing
+        pending = self.submit(stream.__enter__)
+        try:
+            await asyncio.shield(pending)
+            async for chunk in self.chunks(source, self.flattener.workdir):
+                pending = self.submit(stream.feed, chunk)
+                rows = await asyncio.shield(pending)
+                if rows:
+                    yield stream.count, rows
+            pending = self.submit(stream.close)
+            rows = await asyncio.shield(pending)
+            if rows:
+                yield stream.count, rows
+        finally:
+            await asyncio.shield(self._exit(stream, pending))
+
+    async def _exit(self, stream, pending):
+        # writers are not thread safe, they are closed only after the last call has finished
+        await asyncio.wait([pending])
+        await self.run(stream.__exit__, None, None, None)
@@ -10,10 +10,15 @@ from ocdsextensionregistry import ProfileBuilder
 from ocdskit.util import detect_format
 
 from spoonbill import FileAnalyzer, FileFlattener
-from spoonbill.common import COMBINED_TABLES, ROOT_TABLES, TABLE_THRESHOLD
+from spoonbill.common import COMBINED_TABLES, DEDUP_MAX_KEYS, ROOT_TABLES, SURROGATE_KEYS, TABLE_THRESHOLD
+from spoonbill.filters import ReleaseDeduplicator, ReleaseFilter
 from spoonbill.flatten import FlattenOptions
 from spoonbill.i18n import LOCALE, _
-from spoonbill.utils import read_lines, resolve_file_uri
+from spoonbill.remote import input_path, input_size, is_url, open_input, url_filename
+from spoonbill.utils import has_compiled_release, read_lines, resolve_file_uri
+from spoonbill.writers import ColumnStatsWriter, HashPartitionedWriter
+from spoonbill.writers.compression import CODECS
+from spoonbill.writers.csv import MANIFEST_FILENAME
 
 LOGGER = logging.getLogger("spoonbill")
 click_logging.basic_config(LOGGER)
@@ -24,14 +29,28 @@ ANALYZED_LABEL = _("  Processed {} objects")
 FLATTENED_LABEL = _("  Flattened {} objects")
 
 
+class InputPath(click.Path):
+    """Click argument type accepting existing path or http(s) url"""
+
+    def convert(self, value, param, ctx):  # noqa
+        if is_url(value):
+            return value
+        return super().convert(value, param, ctx)
+
+
 class CommaSeparated(click.ParamType):
     """Click option type to convert comma separated string into list"""
 
     name = "comma"
 
+    def __init__(self, lower=True):
+        self.lower = lower
+
     def convert(self, value, param, ctx):  # noqa
         if not value:
             return []
+        if not self.lower:
+            return [v.strip() for v in value.split(",")]
         return [v.lower() for v in value.split(",")]
 
 
@@ -49,6 +68,160 @@ def get_selected_tables(base, selection):
     return {name: tab for name, tab in base.items() if name in selection}
 
 
+def resolve_outputs(csv, xlsx, xlsx_workers=None, xlsx_workbook_rows=None):
+    """Resolve and validate output locations
+
+    :param csv: Directory for csv files
+    :param xlsx: Path to xlsx file
+    :return: Resolved csv and xlsx paths
+    """
+    if csv:
+        csv = pathlib.Path(csv).resolve()
+        if not csv.exists():
+            raise click.BadParameter(_("Desired location {} does not exists").format(csv))
+    if xlsx:
+        xlsx = pathlib.Path(xlsx).resolve()
+        if not xlsx.parent.exists():
+            raise click.BadParameter(_("Desired location {} does not exists").format(xlsx.parent))
+    if xlsx_workers and xlsx_workbook_rows:
+        raise click.BadParameter(_("--xlsx-workers can't be combined with --xlsx-workbook-rows"))
+    return csv, xlsx
+
+
+def resolve_input(filename):
+    """Resolve working directory of input
+
+    Remote input is processed in current directory and named by the last part of its url.
+
+    :param filename: Input path or http(s) url
+    :return: Working directory, filename in it or url and name of input
+    """
+    if is_url(filename):
+        return pathlib.Path("."), filename, url_filename(filename)
+    path = pathlib.Path(filename)
+    return path.parent, path.name, path.name
+
+
+def resolve_root(input_format, filename):
+    """Resolve array of items to flatten, records are flattened using only their compiled releases
+
+    :param input_format: Detected input format
+    :param filename: Input path or http(s) url
+    :return: Array field name and whether compiled releases of records are used
+    """
+    if "release" in input_format:
+        return "releases", False
+    with open_input(filename) as fd:
+        if not has_compiled_release(fd):
+            raise click.BadParameter(
+                _(
+                    "Records without compiledRelease are not supported, the first record has none, "
+                    "please provide release package instead"
+                )
+            )
+    click.echo(_("Using compiled releases of records"))
+    return "records", True
+
+
+def build_selection(spec, selection, split, human, unnest, only, repeat):
+    """Build flattening configuration of every selected table
+
+    :param spec: Analyzed data
+    :param selection: Selected tables
+    :param split: Split child arrays to separate tables
+    :param human: Use human friendly headers
+    :param unnest: Columns to unnest
+    :param only: Columns to output
+    :param repeat: Columns to repeat in child tables
+    :return: Mapping between table name and its configuration
+    """
+    result = {}
+    for name in selection:
+        table = spec[name]
+        if table.total_rows == 0:
+            click.echo(_("Ignoring empty table {}").format(click.style(name, fg="red")))
+            continue
+
+        unnest = [col for col in unnest if col in table.combined_columns]
+        if unnest:
+            click.echo(
+                _("Unnesting columns {} for table {}").format(
+                    click.style(",".join(unnest), fg="cyan"), click.style(name, fg="cyan")
+                )
+            )
+
+        only = [col for col in only if col in table]
+        if only:
+            click.echo(
+                _("Using only columns {} for table {}").format(
+                    click.style(",".join(only), fg="cyan"), click.style(name, fg="cyan")
+                )
+            )
+
+        repeat = [col for col in repeat if col in table]
+        if repeat:
+            click.echo(
+                _("Repeating columns {} in all child table of {}").format(
+                    click.style(",".join(repeat), fg="cyan"), click.style(name, fg="cyan")
+                )
+            )
+
+        result[name] = {
+            "split": split or spec[name].should_split,
+            "pretty_headers": human,
+            "unnest": unnest,
+            "only": only,
+            "repeat": repeat,
+        }
+    return result
+
+
+def print_summary(flattener, compression=None):
+    """Print information about written output
+
+    :param flattener: Flattener which finished its work
+    :param compression: Codec used to compress csv files
+    """
+    for writer in flattener.writers:
+        for table, sheets in getattr(writer, "continuations", {}).items():
+            click.echo(_("Table {} continued in sheets {}").format(table, click.style(",".join(sheets), fg="cyan")))
+        if getattr(writer, "partitioned", False):
+            click.echo(
+                _("Csv files split into parts, listed in {}").format(
+                    click.style(str(writer.workdir / MANIFEST_FILENAME), fg="cyan")
+                )
+            )
+        if isinstance(writer, ColumnStatsWriter):
+            click.echo(_("Column statistics written to {}").format(click.style(str(writer.path), fg="cyan")))
+        if isinstance(writer, HashPartitionedWriter):
+            click.echo(
+                _("Files partitioned by {} into {} buckets, listed in {}").format(
+                    writer.key, writer.buckets, click.style(str(writer.workdir / MANIFEST_FILENAME), fg="cyan")
+                )
+            )
+        paths = getattr(writer, "paths", [])
+        if len(paths) > 1:
+            click.echo(
+                _("Workbook continued in files {}").format(click.style(",".join(map(str, paths[1:])), fg="cyan"))
+            )
+    if compression:
+        click.echo(
+            _("Csv files compressed with {} to {} files").format(
+                click.style(compression, fg="cyan"), click.style("*.csv" + CODECS[compression], fg="cyan")
+            )
+        )
+    stats = flattener.writer_stats
+    if stats:
+        click.echo(
+            _("Writer queue: max depth {}, flattening stalled {:.2f}s, writer idle {:.2f}s, bottleneck is {}").format(
+                stats.max_depth, stats.producer_stall, stats.consumer_idle, stats.bottleneck
+            )
+        )
+    if flattener.dedup:
+        click.echo(_("Skipped {} duplicate releases").format(click.style(str(flattener.dedup.duplicates), fg="red")))
+        flattener.dedup.close()
+
+
 # TODO: we could provide two commands: flatten and analyze
 # TODO: generated state-file + schema how to validate
 
@@ -75,6 +248,25 @@ def get_selected_tables(base, selection):
 )
 @click.option("--xlsx", help=_("Path to result xlsx file"), type=click.Path(), default="result.xlsx")
 @click.option("--csv", help=_("Path to directory for output csv files"), type=click.Path(), required=False)
+@click.option("--sqlite", help=_("Path to result sqlite database"), type=click.Path(), required=False)
+@click.option(
+    "--postgres",
+    help=_("Path to directory for files in postgres COPY format"),
+    type=click.Path(exists=True, file_okay=False, resolve_path=True),
+    required=False,
+)
+@click.option(
+    "--parquet",
+    help=_("Path to directory for output parquet files, requires pyarrow"),
+    type=click.Path(exists=True, file_okay=False, resolve_path=True),
+    required=False,
+)
+@click.option(
+    "--postgres-format",
+    help=_("Postgres COPY format"),
+    type=click.Choice(["text", "binary"]),
+    default="text",
+)
 @click.option("--combine", help=_("Combine same objects to single table"), type=CommaSeparated())
 @click.option(
     "--unnest",
@@ -110,6 +302,29 @@ def get_selected_tables(base, selection):
 @click.option(
     "--count", help=_("For each array field, add a count column to the parent table"), is_flag=True, default=False
 )
+@click.option(
+    "--surrogate-keys",
+    help=_("Add integer rowKey and parentKey columns, either hashes of rowID or sequence numbers"),
+    type=click.Choice(SURROGATE_KEYS),
+)
+@click.option(
+    "--drop-string-ids",
+    help=_("Omit rowID and parentID columns, requires --surrogate-keys"),
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--cluster",
+    help=_("Keep child rows of one parent in a release together and write an index of row ranges next to csv files"),
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--column-stats",
+    help=_("Write null counts, distinct estimates, min, max and maximum length of every column to stats.json"),
+    is_flag=True,
+    default=False,
+)
 @click.option(
     "--human",
     help=_("Use the schema's title properties for column headings"),
@@ -121,8 +336,98 @@ def get_selected_tables(base, selection):
     default=LOCALE.split("_")[0],
     type=click.Choice(["en", "es"]),
 )
+@click.option(
+    "--filter-ocids",
+    help=_("Flatten only releases with ocids listed in a file"),
+    type=click.Path(exists=True),
+    required=False,
+)
+@click.option("--date-from", help=_("Flatten only releases dated on or after this date"), type=str, default="")
+@click.option("--date-to", help=_("Flatten only releases dated on or before this date"), type=str, default="")
+@click.option(
+    "--tag", help=_("Flatten only releases with any of these tags"), type=CommaSeparated(lower=False), default=""
+)
+@click.option(
+    "--buyer",
+    help=_("Flatten only releases with any of these buyer ids"),
+    type=CommaSeparated(lower=False),
+    default="",
+)
+@click.option(
+    "--sorted-by",
+    help=_("Input is sorted by this field, stop reading once filters can't match"),
+    type=click.Choice(["ocid", "date"]),
+    required=False,
+)
+@click.option(
+    "--dedup",
+    help=_("Skip repeated releases identified by ocid and id or by content hash"),
+    type=click.Choice(["id", "hash"]),
+    required=False,
+)
+@click.option(
+    "--dedup-mode",
+    help=_("Keep exact set of seen releases or use memory bounded bloom filter"),
+    type=click.Choice(["exact", "bloom"]),
+    default="exact",
+)
+@click.option(
+    "--dedup-capacity",
+    help=_("Expected number of releases, bloom filter skips unique releases more often past it"),
+    type=click.IntRange(min=1),
+    default=DEDUP_MAX_KEYS,
+    show_default=True,
+)
+@click.option(
+    "--latest",
+    help=_("Flatten only the most recent release for every ocid"),
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--background-writer",
+    help=_("Write output files in separate thread while parsing and flattening"),
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--xlsx-workbook-rows",
+    help=_("Continue xlsx output in a new workbook after this number of rows"),
+    type=int,
+    required=False,
+)
+@click.option(
+    "--xlsx-workers",
+    help=_("Render xlsx sheets in parallel using this number of processes"),
+    type=int,
+    required=False,
+)
+@click.option(
+    "--compression",
+    help=_("Compress csv files using parallel threads"),
+    type=click.Choice(sorted(CODECS)),
+    required=False,
+)
+@click.option(
+    "--csv-max-rows",
+    help=_("Split every csv file into numbered parts with this number of rows"),
+    type=int,
+    required=False,
+)
+@click.option(
+    "--csv-max-bytes",
+    help=_("Split every csv file into numbered parts of this size in bytes"),
+    type=int,
+    required=False,
+)
+@click.option(
+    "--buckets",
+    help=_("Partition csv and parquet files into this number of bucket directories by hash of ocid"),
+    type=click.IntRange(min=1),
+    required=False,
+)
 @click_logging.simple_verbosity_option(LOGGER)
-@click.argument("filename", type=click.Path(exists=True))
+@click.argument("filename", type=InputPath(exists=True))
 def cli(
     filename,
     schema,
@@ -131,6 +436,10 @@ def cli(
     threshold,
     state_file,
     xlsx,
+    sqlite,
+    postgres,
+    postgres_format,
+    parquet,
     csv,
     combine,
     unnest,
@@ -140,8 +449,29 @@ def cli(
     repeat,
     repeat_file,
     count,
+    surrogate_keys,
+    drop_string_ids,
+    cluster,
+    column_stats,
     human,
     language,
+    filter_ocids,
+    date_from,
+    date_to,
+    tag,
+    buyer,
+    sorted_by,
+    dedup,
+    dedup_mode,
+    dedup_capacity,
+    latest,
+    background_writer,
+    xlsx_workbook_rows,
+    xlsx_workers,
+    compression,
+    csv_max_rows,
+    csv_max_bytes,
+    buckets,
 ):
     """Spoonbill cli entry point"""
     click.echo(_("Detecting input file format"))
@@ -151,15 +481,12 @@ def cli(
         input_format,
         _is_concatenated,
         _is_array,
-    ) = detect_format(filename)
-    if csv:
-        csv = pathlib.Path(csv).resolve()
-        if not csv.exists():
-            raise click.BadParameter(_("Desired location {} does not exists").format(csv))
-    if xlsx:
-        xlsx = pathlib.Path(xlsx).resolve()
-        if not xlsx.parent.exists():
-            raise click.BadParameter(_("Desired location {} does not exists").format(xlsx.parent))
+    ) = detect_format(filename, reader=open_input)
+    csv, xlsx = resolve_outputs(csv, xlsx, xlsx_workers, xlsx_workbook_rows)
+    if sqlite:
+        sqlite = pathlib.Path(sqlite).resolve()
+        if not sqlite.parent.exists():
+            raise click.BadParameter(_("Desired location {} does not exists").format(sqlite.parent))
     click.echo(_("Input file is {}").format(click.style(input_format, fg="green")))
     is_package = "package" in input_format
     combine_choice = combine if combine else ""
@@ -169,28 +496,22 @@ def cli(
         return
     if schema:
         schema = resolve_file_uri(schema)
-    if "release" in input_format:
-        root_key = "releases"
-        if not schema:
-            click.echo(_("No schema provided, using version {}").format(click.style(CURRENT_SCHEMA_TAG, fg="cyan")))
-            profile = ProfileBuilder(CURRENT_SCHEMA_TAG, {})
-            schema = profile.release_package_schema()
-    else:
-        root_key = "records"
-        if not schema:
-            click.echo(_("No schema provided, using version {}").format(click.style(CURRENT_SCHEMA_TAG, fg="cyan")))
-            profile = ProfileBuilder(CURRENT_SCHEMA_TAG, {})
-            schema = profile.record_package_schema()
+    root_key, compiled = resolve_root(input_format, filename)
+    if not schema:
+        click.echo(_("No schema provided, using version {}").format(click.style(CURRENT_SCHEMA_TAG, fg="cyan")))
+        profile = ProfileBuilder(CURRENT_SCHEMA_TAG, {})
+        schema = profile.release_package_schema()
     title = schema.get("title", "").lower()
     if not title:
         raise ValueError(_("Incomplete schema, please make sure your data is correct"))
     if "package" in title:
         # TODO: is is a good way to get release/record schema
-        schema = schema["properties"][root_key]["items"]
+        if "releases" not in schema.get("properties", {}):
+            raise click.BadParameter(_("Records are flattened using compiled releases, please provide release schema"))
+        schema = schema["properties"]["releases"]["items"]
 
-    path = pathlib.Path(filename)
-    workdir = path.parent
-    filename = path.name
+    workdir, filename, name = resolve_input(filename)
+    path = input_path(workdir, filename)
     selection = selection or ROOT_TABLES.keys()
     combine = combine or COMBINED_TABLES.keys()
     root_tables = get_selected_tables(ROOT_TABLES, selection)
@@ -209,13 +530,16 @@ def cli(
             combined_tables=combined_tables,
             language=language,
             table_threshold=threshold,
+            dedup=ReleaseDeduplicator(dedup, dedup_mode, capacity=dedup_capacity) if dedup else None,
+            compiled=compiled,
         )
         click.echo(_("Analyze options:"))
         click.echo(_(" - table threshold => {}").format(click.style(str(threshold), fg="cyan")))
         click.echo(_(" - language        => {}").format(click.style(language, fg="cyan")))
         click.echo(_("Processing file: {}").format(click.style(str(path), fg="cyan")))
-        total = path.stat().st_size
+        total = input_size(path) or 0
         progress = 0
+        number = -1
         # Progress bar not showing with small files
         # https://github.com/pallets/click/pull/1296/files
         with click.progressbar(width=0, show_percent=True, show_pos=True, length=total) as bar:
@@ -226,7 +550,12 @@ def cli(
         click.secho(
             _("Done processing. Analyzed objects: {}").format(click.style(str(number + 1), fg="red")), fg="green"
         )
-        state_file = pathlib.Path(f"{filename}.state")
+        if analyzer.dedup:
+            click.echo(
+                _("Skipped {} duplicate releases").format(click.style(str(analyzer.dedup.duplicates), fg="red"))
+            )
+            analyzer.dedup.close()
+        state_file = pathlib.Path(f"{name}.state")
         state_file_path = workdir / state_file
         click.echo(_("Dumping analyzed data to '{}'").format(click.style(str(state_file_path.absolute()), fg="cyan")))
         analyzer.dump_to_file(state_file)
@@ -240,49 +569,32 @@ def cli(
     if only and only_file:
         raise click.UsageError(_("Conflicting options: only and only-file"))
 
-    options = {"selection": {}, "count": count}
+    if drop_string_ids and not surrogate_keys:
+        raise click.UsageError(_("--drop-string-ids requires --surrogate-keys"))
+
     unnest = read_option_file(unnest, unnest_file)
     repeat = read_option_file(repeat, repeat_file)
     only = read_option_file(only, only_file)
-
-    for name in selection:
-        table = analyzer.spec[name]
-        if table.total_rows == 0:
-            click.echo(_("Ignoring empty table {}").format(click.style(name, fg="red")))
-            continue
-
-        unnest = [col for col in unnest if col in table.combined_columns]
-        if unnest:
-            click.echo(
-                _("Unnesting columns {} for table {}").format(
-                    click.style(",".join(unnest), fg="cyan"), click.style(name, fg="cyan")
-                )
-            )
-
-        only = [col for col in only if col in table]
-        if only:
-            click.echo(
-                _("Using only columns {} for table {}").format(
-                    click.style(",".join(only), fg="cyan"), click.style(name, fg="cyan")
-                )
-            )
-
-        repeat = [col for col in repeat if col in table]
-        if repeat:
-            click.echo(
-                _("Repeating columns {} in all child table of {}").format(
-                    click.style(",".join(repeat), fg="cyan"), click.style(name, fg="cyan")
-                )
-            )
-
-        options["selection"][name] = {
-            "split": split or analyzer.spec[name].should_split,
-            "pretty_headers": human,
-            "unnest": unnest,
-            "only": only,
-            "repeat": repeat,
-        }
+    options = {
+        "selection": build_selection(analyzer.spec, selection, split, human, unnest, only, repeat),
+        "count": count,
+        "surrogate_keys": surrogate_keys or "",
+        "drop_string_ids": drop_string_ids,
+        "cluster": cluster,
+    }
     options = FlattenOptions(**options)
+    release_filter = ReleaseFilter(
+        ocids=[ocid for ocid in read_lines(filter_ocids) if ocid] if filter_ocids else [],
+        date_from=date_from,
+        date_to=date_to,
+        tags=tag,
+        buyers=buyer,
+        sorted_by=sorted_by or "",
+    )
+    if release_filter:
+        click.echo(_("Flattening only releases matching provided filters"))
+    if latest:
+        click.echo(_("Flattening only the most recent release for every ocid"))
     flattener = FileFlattener(
         workdir,
         options,
@@ -290,7 +602,23 @@ def cli(
         root_key=root_key,
         csv=csv,
         xlsx=xlsx,
+        sqlite=sqlite,
+        postgres=postgres,
+        postgres_format=postgres_format,
+        parquet=parquet,
         language=language,
+        release_filter=release_filter or None,
+        dedup=ReleaseDeduplicator(dedup, dedup_mode, capacity=dedup_capacity) if dedup else None,
+        latest=latest,
+        compiled=compiled,
+        background=background_writer,
+        xlsx_workbook_rows=xlsx_workbook_rows,
+        xlsx_workers=xlsx_workers,
+        csv_compression=compression,
+        csv_max_rows=csv_max_rows,
+        csv_max_bytes=csv_max_bytes,
+        buckets=buckets,
+        column_stats=column_stats,
     )
 
     all_tables = chain([table for table in flattener.flattener.tables.keys()], combine_choice)
@@ -306,6 +634,7 @@ def cli(
         else:
             click.echo(message)
     click.echo(_("Flattening input file"))
+    count = -1
     with click.progressbar(
         flattener.flatten_file(filename),
         length=analyzer.spec.total_items + 1,
@@ -317,3 +646,4 @@ def cli(
             bar.label = FLATTENED_LABEL.format(click.style(str(count + 1), fg="cyan"))
 
     click.secho(_("Done flattening. Flattened objects: {}").format(click.style(str(count + 1), fg="red")), fg="green")
+    print_summary(flattener, compression if csv else None)
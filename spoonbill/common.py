@@ -35,9 +35,15 @@ COMBINED_TABLES = {
 
 DEFAULT_FIELDS = ["ocid", "id", "rowID", "parentID"]
 DEFAULT_FIELDS_COMBINED = ["ocid", "id", "rowID", "parentID", "parentTable"]
+# surrogate keys generation modes
+SURROGATE_KEYS = ("hash", "sequence")
 
 ARRAY = "array of {}"
 # TODO: is joinable good name?
 JOINABLE = "joinable"
 JOINABLE_SEPARATOR = ";"
 TABLE_THRESHOLD = 5
+# number of release keys kept in memory during deduplication
+DEDUP_MAX_KEYS = 1_000_000
+# number of releases flattened before rows are passed to writers
+RELEASES_BATCH_SIZE = 100
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import math
+import sqlite3
+from dataclasses import dataclass, field
+from typing import List, Set
+
+from spoonbill.common import DEDUP_MAX_KEYS
+from spoonbill.i18n import _
+
+LOGGER = logging.getLogger("spoonbill")
+
+
+@dataclass
+class ReleaseFilter:
+    """Release level predicates
+
+    Dates are compared as ISO 8601 strings, so partial dates like `2010-03` select whole month.
+    All configured predicates must match for release to be kept.
+
+    :param ocids: Keep only releases with these ocids
+    :param date_from: Keep only releases dated on or after this date
+    :param date_to: Keep only releases dated on or before this date
+    :param tags: Keep only releases with at least one of these tags
+    :param buyers: Keep only releases with one of these buyer ids
+    :param sorted_by: Input is sorted by `ocid` or `date`, stop reading once predicates can't match anymore
+    """
+
+    ocids: Set[str] = field(default_factory=set)
+    date_from: str = ""
+    date_to: str = ""
+    tags: List[str] = field(default_factory=list)
+    buyers: List[str] = field(default_factory=list)
+    sorted_by: str = ""
+
+    def __post_init__(self):
+        self.ocids = set(self.ocids)
+        self._tags = set(self.tags)
+        self._buyers = set(self.buyers)
+        self._max_ocid = max(self.ocids) if self.ocids else None
+
+    def __bool__(self):
+        return bool(self.ocids or self.date_from or self.date_to or self.tags or self.buyers)
+
+    def __call__(self, release):
+        """Check if release matches all predicates
+
+        >>> ReleaseFilter(ocids={'a'})({'ocid': 'a'})
+        True
+        >>> ReleaseFilter(date_from='2010-03', date_to='2010-03')({'date': '2010-03-15T09:30:00Z'})
+        True
+        >>> ReleaseFilter(date_to='2010-02')({'date': '2010-03-15T09:30:00Z'})
+        False
+        >>> ReleaseFilter(tags=['award'])({'tag': ['tender', 'award']})
+        True
+        >>> ReleaseFilter(buyers=['b'])({'buyer': {'id': 'a'}})
+        False
+        """
+        if self.ocids and release.get("ocid") not in self.ocids:
+            return False
+        if self.date_from or self.date_to:
+            date = release.get("date") or ""
+            if not date:
+                return False
+            if self.date_from and date < self.date_from:
+                return False
+            if self.date_to and date[: len(self.date_to)] > self.date_to:
+                return False
+        if self._tags and not self._tags.intersection(release.get("tag") or []):
+            return False
+        if self._buyers:
+            buyer = release.get("buyer") or {}
+            if buyer.get("id") not in self._buyers:
+                return False
+        return True
+
+    def exhausted(self, release):
+        """Check if no following release could match, assuming input is sorted by `sorted_by` field
+
+        >>> ReleaseFilter(ocids={'a', 'b'}, sorted_by='ocid').exhausted({'ocid': 'c'})
+        True
+        >>> ReleaseFilter(date_to='2010', sorted_by='date').exhausted({'date': '2010-12-01'})
+        False
+        """
+        if self.sorted_by == "ocid" and self._max_ocid is not None:
+            return (release.get("ocid") or "") > self._max_ocid
+        if self.sorted_by == "date" and self.date_to:
+            date = release.get("date") or ""
+            return date[: len(self.date_to)] > self.date_to
+        return False
+
+
+def filter_releases(releases, predicate):
+    """Skip releases not matching `predicate`
+
+    :param releases: Iterable of releases
+    :param predicate: Callable returning True for releases to keep, usually `ReleaseFilter`
+    :return: Iterator over matching releases
+    """
+    exhausted = getattr(predicate, "exhausted", None)
+    for release in releases:
+        if exhausted and exhausted(release):
+            LOGGER.info(_("Sorted input passed filter bounds, skipping rest of the file"))
+            break
+        if predicate(release):
+            yield release
+
+
+class BloomFilter:
+    """Probabilistic set with bounded memory
+
+    :param capacity: Expected number of items
+    :param error_rate: Acceptable false positive rate
+
+    >>> bloom = BloomFilter(100)
+    >>> bloom.add(b'key')
+    False
+    >>> bloom.add(b'key')
+    True
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, digest):
+        """Add digest to filter
+
+        :param digest: Item digest, at least 16 bytes long
+        :return: True if item probably was already added
+        """
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        found = True
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % self.size
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self.bits[byte] & mask:
+                found = False
+                self.bits[byte] |= mask
+        return found
+
+
+class ReleaseDeduplicator:
+    """Predicate to skip repeated releases
+
+    Keys are stored as 16 bytes digests, when more than `max_keys` are seen in exact mode
+    keys are spilled to temporary sqlite database.
+    In bloom mode false positive rate grows past `error_rate` once more than `capacity` releases are seen,
+    so unique releases may be skipped as duplicates, warning is logged when it happens.
+
+    :param key: `id` to identify release by (ocid, id) pair or `hash` to use hash of release content
+    :param mode: `exact` to keep all seen keys or `bloom` to use bloom filter with `error_rate` false positives
+    :param max_keys: Maximum number of keys kept in memory in exact mode
+    :param capacity: Expected number of releases in bloom mode
+    :param error_rate: Bloom filter false positive rate
+    """
+
+    def __init__(self, key="id", mode="exact", max_keys=DEDUP_MAX_KEYS, capacity=DEDUP_MAX_KEYS, error_rate=0.001):
+        if key not in ("id", "hash"):
+            raise ValueError(_("Unknown deduplication key {}").format(key))
+        if mode not in ("exact", "bloom"):
+            raise ValueError(_("Unknown deduplication mode {}").format(mode))
+        self.key = key
+        self.mode = mode
+        self.max_keys = max_keys
+        self.capacity = capacity
+        self.total = 0
+        self.duplicates = 0
+        self._seen = set()
+        self._spill = None
+        self._bloom = BloomFilter(capacity, error_rate) if mode == "bloom" else None
+
+    def digest(self, release):
+        """Calculate release key digest"""
+        if self.key == "id":
+            data = "\0".join((str(release.get("ocid", "")), str(release.get("id", "")))).encode()
+        else:
+            data = json.dumps(release, sort_keys=True, default=str).encode()
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def __call__(self, release):
+        """Check if release is seen for the first time
+
+        >>> dedup = ReleaseDeduplicator()
+        >>> [dedup({'ocid': 'a', 'id': '1'}), dedup({'ocid': 'a', 'id': '1'}), dedup({'ocid': 'a', 'id': '2'})]
+        [True, False, True]
+        >>> dedup.duplicates
+        1
+        """
+        self.total += 1
+        digest = self.digest(release)
+        if self._bloom:
+            if self.total == self.capacity + 1:
+                LOGGER.warning(
+                    _(
+                        "More than {} releases seen, bloom filter may skip unique releases, increase its capacity"
+                    ).format(self.capacity)
+                )
+            duplicate = self._bloom.add(digest)
+        else:
+            duplicate = self._add(digest)
+        if duplicate:
+            self.duplicates += 1
+        return not duplicate
+
+    def _add(self, digest):
+        if digest in self._seen:
+            return True
+        if self._spill:
+            if self._spill.execute("SELECT 1 FROM seen WHERE digest = ?", (digest,)).fetchone():
+                return True
+        self._seen.add(digest)
+        if len(self._seen) >= self.max_keys:
+            self._flush()
+        return False
+
+    def _flush(self):
+        if not self._spill:
+            # empty name creates private temporary database removed on close
+            self._spill = sqlite3.connect("")
+            self._spill.execute("CREATE TABLE seen (digest BLOB PRIMARY KEY) WITHOUT ROWID")
+        with self._spill:
+            self._spill.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((d,) for d in self._seen))
+        self._seen.clear()
+
+    def close(self):
+        """Release memory and temporary storage"""
+        if self._spill:
+            self._spill.close()
+            self._spill = None
+        self._seen.clear()
@@ -1,12 +1,13 @@
 import logging
-from collections import defaultdict, deque
-from dataclasses import dataclass, field, is_dataclass
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass, field, is_dataclass, replace
+from itertools import count as sequence
 from typing import List, Mapping, Sequence
 
-from spoonbill.common import DEFAULT_FIELDS, JOINABLE, JOINABLE_SEPARATOR
+from spoonbill.common import DEFAULT_FIELDS, JOINABLE, JOINABLE_SEPARATOR, SURROGATE_KEYS
 from spoonbill.i18n import LOCALE, _
-from spoonbill.spec import Table
-from spoonbill.utils import generate_row_id, get_matching_tables, get_pointer, get_root
+from spoonbill.spec import Column, Table, copy_tables
+from spoonbill.utils import cluster_rows, generate_row_id, generate_row_key, get_matching_tables, get_pointer, get_root
 
 LOGGER = logging.getLogger("spoonbill")
 
@@ -39,17 +40,33 @@ class FlattenOptions:
     :param selection: List of selected tables to extract from data
     :param count: Include number of rows in child table in each parent table
     :param exclude: List of tables to exclude from export
+    :param surrogate_keys: Add integer `rowKey` and `parentKey` columns, either `hash` or `sequence`
+    :param drop_string_ids: Omit `rowID` and `parentID` columns, requires `surrogate_keys`
+    :param cluster: Keep rows of every child table with the same parent in a release together
+        and write index of row ranges
     """
 
     selection: Mapping[str, TableFlattenConfig]
     exclude: List[str] = field(default_factory=list)
     count: bool = False
+    surrogate_keys: str = ""
+    drop_string_ids: bool = False
+    cluster: bool = False
 
     def __post_init__(self):
+        if self.surrogate_keys and self.surrogate_keys not in SURROGATE_KEYS:
+            raise ValueError(_("Unsupported surrogate keys mode {}").format(self.surrogate_keys))
+        if self.drop_string_ids and not self.surrogate_keys:
+            raise ValueError(_("Dropping string ids requires surrogate keys"))
         for name, table in self.selection.items():
             if not is_dataclass(table):
                 self.selection[name] = TableFlattenConfig(**table)
 
+    @property
+    def parent_column(self):
+        """Column referencing parent of the row"""
+        return "parentKey" if self.drop_string_ids else "parentID"
+
 
 class Flattener:
     """Data flattener
@@ -64,6 +81,19 @@ class Flattener:
     * ocid
     For child tables this list well be extended with `parentID` column.
 
+    With `surrogate_keys` option every row also gets 64-bit integer `rowKey` and
+    child rows get `parentKey` with `rowKey` of the row generated from the closest parent object.
+    In `hash` mode keys are hashes of rowID and object path, stable across runs and exports.
+    In `sequence` mode keys are sequential numbers starting from 1 on every `flatten` call, unique only within it.
+
+    With `cluster` option rows of every child table are grouped by parent within each release,
+    so child rows of one parent in a release always come out as a single contiguous run.
+    Parent ids repeat in every release of an ocid, rows of the same parent from different releases are not merged.
+
+    Provided tables and options are never modified, flattener works with its own copy of them
+    and keeps no per release state, so single analyzed state could be used by
+    multiple flatteners running in different threads.
+
     :param options: Flattening options
     :param tables: Analyzed tables data
     """
@@ -71,9 +101,9 @@ class Flattener:
     def __init__(self, options: FlattenOptions, tables: Mapping[str, Table], language=LOCALE):
         if not is_dataclass(options):
             options = FlattenOptions(**options)
-        self.options = options
-        self.tables = tables
+        self.options = replace(options, selection=dict(options.selection))
         self.language = language
+        tables = copy_tables(tables)
 
         self._lookup_cache = {}
         self._types_cache = {}
@@ -97,6 +127,9 @@ class Flattener:
                 c_table = tables[c_name]
                 self._init_child_tables(tables, table, c_table, options)
         self._init_options(self.tables)
+        if self.options.surrogate_keys:
+            for table in self.tables.values():
+                self._init_keys(table)
 
     def _init_child_tables(self, tables, table, c_table, options):
         split = options.split
@@ -199,6 +232,23 @@ class Flattener:
                             child_table.combined_columns[col_id] = col
                             child_table.titles[col_id] = title
 
+    def _init_keys(self, table):
+        drop = self.options.drop_string_ids
+        for attr in ("columns", "combined_columns"):
+            columns = OrderedDict()
+            for col_id, col in getattr(table, attr).items():
+                if col_id == "rowID":
+                    columns["rowKey"] = Column("rowKey", "integer", "rowKey", hits=table.total_rows)
+                elif col_id == "parentID":
+                    hits = 0 if table.is_root else table.total_rows
+                    columns["parentKey"] = Column("parentKey", "integer", "parentKey", hits=hits)
+                if col_id in ("rowID", "parentID") and drop:
+                    continue
+                columns[col_id] = col
+            setattr(table, attr, columns)
+        table.titles["rowKey"] = _("rowKey", self.language)
+        table.titles["parentKey"] = _("parentKey", self.language)
+
     def _only(self, table, only, split):
         only = only + DEFAULT_FIELDS
         columns = table.columns
@@ -211,22 +261,28 @@ class Flattener:
         table.combined_columns = columns
         table.types = not_columns
 
-    def flatten(self, releases):
+    def flatten(self, releases, row_keys=None):
         """Flatten releases
 
         :param releases: releases as iterable object
+        :param row_keys: Iterator of `sequence` surrogate keys, to continue numbering of previous calls
+            when input is flattened in several calls. New sequence starting from 1 is used if not set
         :return: Iterator over mapping between table name and list of rows for each release
         """
 
+        if row_keys is None:
+            row_keys = sequence(1)
         for counter, release in enumerate(releases):
             rows = defaultdict(list)
-            to_flatten = deque([("", "", "", {}, release, {})])
+            to_flatten = deque([("", "", "", {}, release, {}, None)])
             separator = "/"
             ocid = release["ocid"]
             top_level_id = release["id"]
+            keys = self.options.surrogate_keys
+            drop = self.options.drop_string_ids
 
             while to_flatten:
-                abs_path, path, parent_key, parent, record, repeat = to_flatten.pop()
+                abs_path, path, parent_key, parent, record, repeat, row_key = to_flatten.pop()
 
                 table = self._path_cache.get(path)
                 if table:
@@ -238,6 +294,14 @@ class Flattener:
                         "parentID": parent.get("id"),
                         "ocid": ocid,
                     }
+                    if keys:
+                        parent_row_key = row_key
+                        row_key = generate_row_key(row_id, abs_path) if keys == "hash" else next(row_keys)
+                        new_row["rowKey"] = row_key
+                        if not table.is_root:
+                            new_row["parentKey"] = parent_row_key
+                        if drop:
+                            del new_row["rowID"], new_row["parentID"]
                     if table.is_root:
                         repeat = {}
                     if repeat:
@@ -260,7 +324,7 @@ class Flattener:
                         repeat[pointer] = item
 
                     if isinstance(item, dict):
-                        to_flatten.append((abs_pointer, pointer, key, record, item, repeat))
+                        to_flatten.append((abs_pointer, pointer, key, record, item, repeat, row_key))
                     elif isinstance(item, list):
                         if item_type == JOINABLE:
                             value = JOINABLE_SEPARATOR.join(item)
@@ -295,6 +359,7 @@ class Flattener:
                                             record,
                                             value,
                                             repeat,
+                                            row_key,
                                         )
                                     )
                     else:
@@ -306,4 +371,8 @@ class Flattener:
                                 continue
                         pointer = get_pointer(table, abs_pointer, pointer, split, separator=separator)
                         rows[table.name][-1][pointer] = item
+            if self.options.cluster:
+                for name, table_rows in rows.items():
+                    if not self.tables[name].is_root:
+                        rows[name] = cluster_rows(table_rows, self.options.parent_column)
             yield counter, rows
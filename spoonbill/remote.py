@@ -0,0 +1,182 @@
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+from spoonbill.i18n import _
+
+LOGGER = logging.getLogger("spoonbill")
+
+BLOCK_SIZE = 4 * 1024 * 1024
+WORKERS = 4
+TIMEOUT = 60
+
+
+def is_url(path):
+    """Check if `path` is http(s) url
+
+    >>> is_url("https://example.com/data.json")
+    True
+    >>> is_url("data/https.json")
+    False
+    """
+    return str(path).startswith(("http://", "https://"))
+
+
+def url_filename(url, default="data.json"):
+    """Last part of url path, used to name files derived from remote input
+
+    >>> url_filename("https://example.com/files/data.json?page=1")
+    'data.json'
+    >>> url_filename("https://example.com/")
+    'data.json'
+    """
+    return urlparse(url).path.rsplit("/", 1)[-1] or default
+
+
+def input_path(workdir, filename):
+    """Location of input `filename`, urls are kept as is and paths are resolved in `workdir`"""
+    if is_url(filename):
+        return filename
+    return workdir / filename
+
+
+class RangeReader(io.RawIOBase):
+    """Seekable binary stream reading remote file with HTTP Range requests
+
+    File is read in blocks of `block_size` bytes, up to `workers` following blocks are fetched in parallel
+    while current one is being consumed, so throughput is not limited by latency of single connection.
+
+    :param url: File url, server must support byte ranges
+    :param size: File size in bytes
+    :param block_size: Number of bytes fetched with single request
+    :param workers: Number of blocks fetched in parallel
+    """
+
+    def __init__(self, url, size, block_size=BLOCK_SIZE, workers=WORKERS):
+        super().__init__()
+        self.url = url
+        self.size = size
+        self.block_size = block_size
+        self.workers = workers
+        self.blocks = -(-size // block_size)
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="spoonbill-fetch")
+        self.requests = 0
+        self._position = 0
+        self._pending = {}
+        self._block_index = None
+        self._block = b""
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _fetch(self, index):
+        start = index * self.block_size
+        end = min(start + self.block_size, self.size) - 1
+        response = self._session().get(self.url, headers={"Range": f"bytes={start}-{end}"}, timeout=TIMEOUT)
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise IOError(_("Server ignored range request for {}").format(self.url))
+        with self._lock:
+            self.requests += 1
+        return response.content
+
+    def _get_block(self, index):
+        for stale in [i for i in self._pending if i < index or i >= index + self.workers]:
+            self._pending.pop(stale).cancel()
+        for i in range(index, min(index + self.workers, self.blocks)):
+            if i not in self._pending:
+                self._pending[i] = self.executor.submit(self._fetch, i)
+        return self._pending.pop(index).result()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._position >= self.size:
+            return 0
+        index = self._position // self.block_size
+        if index != self._block_index:
+            self._block = self._get_block(index)
+            self._block_index = index
+        offset = self._position - index * self.block_size
+        end = offset + len(buffer)
+        data = self._block[offset:end]
+        read = len(data)
+        buffer[:read] = data
+        self._position += read
+        return read
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if self.closed:
+            return
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self.executor.shutdown(wait=True)
+        for session in self._sessions:
+            session.close()
+        super().close()
+
+
+def input_size(path):
+    """Size of local or remote input in bytes, None if unknown"""
+    if not is_url(path):
+        return path.stat().st_size
+    response = requests.head(path, allow_redirects=True, timeout=TIMEOUT)
+    response.raise_for_status()
+    size = response.headers.get("Content-Length")
+    return int(size) if size else None
+
+
+def open_input(path, mode="rb", block_size=BLOCK_SIZE, workers=WORKERS):
+    """Open local file or http(s) url for binary reading
+
+    Urls of servers supporting byte ranges are read with `RangeReader` fetching blocks in parallel,
+    other urls are streamed with single request and can't be read more than once.
+
+    :param path: Local path or url
+    :param mode: Opening mode, only `rb` is supported for urls
+    :param block_size: Number of bytes fetched with single range request
+    :param workers: Number of blocks fetched in parallel
+    :return: Binary file object
+    """
+    if not is_url(path):
+        return open(path, mode)
+    if mode != "rb":
+        raise ValueError(_("Urls could be opened only for binary reading"))
+    response = requests.head(path, allow_redirects=True, timeout=TIMEOUT)
+    response.raise_for_status()
+    size = response.headers.get("Content-Length")
+    if size and response.headers.get("Accept-Ranges") == "bytes":
+        return io.BufferedReader(RangeReader(response.url, int(size), block_size=block_size, workers=workers))
+    LOGGER.info(_("Server does not support range requests, streaming {}").format(path))
+    response = requests.get(path, stream=True, timeout=TIMEOUT)
+    response.raise_for_status()
+    response.raw.decode_content = True
+    return response.raw
@@ -1,6 +1,6 @@
 import logging
 from collections import OrderedDict
-from dataclasses import asdict, dataclass, field, is_dataclass
+from dataclasses import asdict, dataclass, field, is_dataclass, replace
 from typing import List, Mapping, Sequence
 
 from spoonbill.common import DEFAULT_FIELDS, DEFAULT_FIELDS_COMBINED
@@ -237,3 +237,38 @@ def add_child_table(table, pointer, parent_key, key):
         t.arrays[pointer] = 0
         t.arrays[pointer] = 0
     return child_table
+
+
+def copy_tables(tables):
+    """Copy tables metadata, so copies can be modified without affecting original tables
+
+    Columns, titles, arrays and types are copied, parent links point to copied tables
+    and previews are shared with original tables.
+
+    :param tables: Mapping between table name and table
+    :return: Mapping between table name and its copy
+    """
+    copies = {}
+
+    def copy(table):
+        key = id(table)
+        if key not in copies:
+            parent = copy(table.parent) if table.parent else table.parent
+            copies[key] = replace(
+                table,
+                parent=parent,
+                columns=_copy_columns(table.columns),
+                combined_columns=_copy_columns(table.combined_columns),
+                additional_columns=_copy_columns(table.additional_columns),
+                arrays=dict(table.arrays),
+                titles=dict(table.titles),
+                child_tables=list(table.child_tables),
+                types=dict(table.types),
+            )
+        return copies[key]
+
+    return {name: copy(table) for name, table in tables.items()}
+
+
+def _copy_columns(columns):
+    return OrderedDict((name, replace(col)) for name, col in columns.items())
@@ -175,7 +175,7 @@ class DataPreprocessor:
         self.current_table.preview_rows.append(defaults)
         self.current_table.preview_rows_combined.append(defaults)
 
-    def process_items(self, releases, with_preview=True):
+    def process_items(self, releases, with_preview=True, start=0):
         """Analyze releases
 
         Iterate over every item in provided list to
@@ -183,9 +183,11 @@ class DataPreprocessor:
 
         :param releases: Iterator of items to analyze
         :param with_preview: If set to True generates previews for each table
+        :param start: Index of the first item, when items are analyzed in several calls
         """
         separator = self.header_separator
-        for count, release in enumerate(releases):
+        count = start - 1
+        for count, release in enumerate(releases, start):
             to_analyze = deque([("", "", "", {}, release)])
             ocid = release["ocid"]
             top_level_id = release["id"]
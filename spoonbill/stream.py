@@ -0,0 +1,150 @@
+from collections import OrderedDict, defaultdict
+from contextlib import ExitStack
+from itertools import count as sequence
+
+import ijson
+
+from spoonbill.filters import filter_releases
+from spoonbill.i18n import _
+from spoonbill.utils import item_prefix
+
+
+class ItemParser:
+    """Push parser building items of `root` array from chunks of json document
+
+    >>> parser = ItemParser("releases")
+    >>> [dict(item) for item in parser.feed(b'{"releases": [{"ocid": "a"}, {"oc')]
+    [{'ocid': 'a'}]
+    >>> [dict(item) for item in parser.feed(b'id": "b"}]}')]
+    [{'ocid': 'b'}]
+
+    :param root: Array field name inside document
+    :param compiled: Build only compiled releases of records
+    """
+
+    def __init__(self, root="releases", compiled=False):
+        self._items = ijson.sendable_list()
+        self._coro = ijson.items_coro(self._items, item_prefix(root, compiled), map_type=OrderedDict)
+
+    def _drain(self):
+        items = list(self._items)
+        del self._items[:]
+        return items
+
+    def feed(self, chunk):
+        """Parse next chunk of document
+
+        :param chunk: Bytes of document
+        :return: List of items completed by this chunk
+        """
+        if chunk:
+            self._coro.send(chunk)
+        return self._drain()
+
+    def close(self):
+        """Finish parsing, fails if document is incomplete
+
+        :return: List of remaining items
+        """
+        self._coro.close()
+        return self._drain()
+
+
+class StreamAnalyzer:
+    """Analyze json document fed in chunks, e.g. while it is being uploaded
+
+    Analysis results are collected in `spec` of provided analyzer, exactly as with `FileAnalyzer.analyze_file`.
+
+    :param analyzer: `FileAnalyzer` with analysis configuration
+    :param with_preview: Generate preview during analysis
+    """
+
+    def __init__(self, analyzer, with_preview=True):
+        self.analyzer = analyzer
+        self.with_preview = with_preview
+        self.parser = ItemParser(analyzer.root_key, compiled=analyzer.compiled)
+        self.count = 0
+
+    def _analyze(self, items):
+        if self.analyzer.dedup:
+            items = list(filter_releases(items, self.analyzer.dedup))
+        if items:
+            for _count in self.analyzer.spec.process_items(items, with_preview=self.with_preview, start=self.count):
+                pass
+            self.count += len(items)
+        return self.count
+
+    def feed(self, chunk):
+        """Analyze items completed by next chunk of document
+
+        :param chunk: Bytes of document
+        :return: Number of items analyzed so far
+        """
+        return self._analyze(self.parser.feed(chunk))
+
+    def close(self):
+        """Analyze remaining items
+
+        :return: Total number of analyzed items
+        """
+        return self._analyze(self.parser.close())
+
+
+class StreamFlattener:
+    """Flatten json document fed in chunks, e.g. while it is being uploaded
+
+    Options, input filters and writers of provided `FileFlattener` are used.
+    Rows of items completed by every chunk are returned and, when used as context manager, passed to writers.
+    Selecting only the latest releases requires whole input and is not supported.
+
+    :param flattener: `FileFlattener` with flattening configuration
+    """
+
+    def __init__(self, flattener):
+        if flattener.latest:
+            raise ValueError(_("Latest releases can't be selected from streamed input"))
+        self.flattener = flattener
+        self.parser = ItemParser(flattener.root_key, compiled=flattener.compiled)
+        self.count = 0
+        # sequence surrogate keys continue across chunks
+        self.row_keys = sequence(1)
+        self.writers = []
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        with ExitStack() as stack:
+            self.writers = self.flattener._open_writers(stack)
+            self._stack = stack.pop_all()
+        return self
+
+    def __exit__(self, *args):
+        self._stack.__exit__(*args)
+
+    def _flatten(self, items):
+        if self.flattener.release_filter:
+            items = filter_releases(items, self.flattener.release_filter)
+        if self.flattener.dedup:
+            items = filter_releases(items, self.flattener.dedup)
+        batch = defaultdict(list)
+        for _count, data in self.flattener.flattener.flatten(items, row_keys=self.row_keys):
+            self.count += 1
+            for table, rows in data.items():
+                batch[table].extend(rows)
+        if self.writers:
+            self.flattener._write(self.writers, batch)
+        return batch
+
+    def feed(self, chunk):
+        """Flatten items completed by next chunk of document
+
+        :param chunk: Bytes of document
+        :return: Mapping between table name and list of rows
+        """
+        return self._flatten(self.parser.feed(chunk))
+
+    def close(self):
+        """Flatten remaining items
+
+        :return: Mapping between table name and list of rows
+        """
+        return self._flatten(self.parser.close())
@@ -1,12 +1,12 @@
 import codecs
 import functools
+import hashlib
 import json
 import logging
 from collections import OrderedDict
 from dataclasses import replace
 from itertools import chain
 from numbers import Number
-from pathlib import Path
 
 import ijson
 import requests
@@ -61,21 +61,147 @@ def common_prefix(path, subpath, separator="/"):
     return separator.join(common)
 
 
-def iter_file(fd, root):
+def item_prefix(root, compiled=False):
+    """Build ijson prefix to objects inside `root` array
+
+    :param str root: Array field name inside file
+    :param bool compiled: Use only compiled release of each record
+    :return: ijson prefix
+
+    >>> item_prefix('releases')
+    'releases.item'
+    >>> item_prefix('records', compiled=True)
+    'records.item.compiledRelease'
+    """
+    prefix = f"{root}.item"
+    if compiled:
+        prefix = f"{prefix}.compiledRelease"
+    return prefix
+
+
+def iter_file(fd, root, compiled=False):
     """Iterate over `root` array in file provided by `filename` using ijson
 
+    With `compiled` set only `compiledRelease` of every record is built,
+    embedded `releases` and `versionedRelease` are skipped by parser.
+    Records without `compiledRelease` are skipped, their number is logged as warning.
+
     :param bytes fd: File descriptor
     :param str root: Array field name inside file
+    :param bool compiled: Iterate over compiled releases of records
     :return: Iterator of bytes read and item as a tuple
 
     >>> [r for r in iter_file(open('tests/data/ocds-sample-data.json', 'rb'), 'records')]
     []
     >>> len([r for r in iter_file(open('tests/data/ocds-sample-data.json', 'rb'), 'releases')])
     6
+    >>> import io
+    >>> data = b'{"records": [{"ocid": "a", "compiledRelease": {"ocid": "a"}, "releases": [{"ocid": "a"}]}]}'
+    >>> [dict(r) for r in iter_file(io.BytesIO(data), 'records', compiled=True)]
+    [{'ocid': 'a'}]
     """
-    reader = ijson.items(fd, f"{root}.item", map_type=OrderedDict)
-    for item in reader:
-        yield item
+    if not compiled:
+        yield from ijson.items(fd, item_prefix(root), map_type=OrderedDict)
+        return
+    skipped = []
+    yield from ijson.items(
+        count_missing_compiled(ijson.parse(fd), root, skipped), item_prefix(root, compiled), map_type=OrderedDict
+    )
+    if skipped:
+        LOGGER.warning("Skipped %s records without compiledRelease", len(skipped))
+
+
+def count_missing_compiled(events, root, skipped):
+    """Pass parser events through, appending ocid of every record without `compiledRelease` to `skipped`"""
+    item = f"{root}.item"
+    ocid = f"{item}.ocid"
+    found, record_ocid = False, None
+    for event in events:
+        prefix = event[0]
+        if prefix == item:
+            if event[1] == "map_key" and event[2] == "compiledRelease":
+                found = True
+            elif event[1] == "end_map":
+                if not found:
+                    skipped.append(record_ocid)
+                found, record_ocid = False, None
+        elif prefix == ocid:
+            record_ocid = event[2]
+        yield event
+
+
+def has_compiled_release(fd, root="records"):
+    """Check if the first record in `root` array has `compiledRelease`
+
+    Only parser events of the first record are read, empty array passes the check.
+
+    :param bytes fd: File descriptor
+    :param str root: Array field name inside file
+    :return: False if the first record has no compiled release
+
+    >>> import io
+    >>> has_compiled_release(io.BytesIO(b'{"records": [{"ocid": "a", "compiledRelease": {"ocid": "a"}}]}'))
+    True
+    >>> has_compiled_release(io.BytesIO(b'{"records": [{"ocid": "a", "releases": [{"url": "a.json"}]}]}'))
+    False
+    >>> has_compiled_release(io.BytesIO(b'{"records": []}'))
+    True
+    """
+    item = f"{root}.item"
+    compiled = f"{item}.compiledRelease"
+    for prefix, event, _value in ijson.parse(fd):
+        if prefix == compiled:
+            return True
+        if prefix == item and event == "end_map":
+            return False
+    return True
+
+
+def latest_releases(fd, root):
+    """Find the most recent release for every ocid in `root` array
+
+    Only ocid and date values are extracted from parser events, so no release is built in memory.
+    Releases with equal dates are resolved in favor of the one found later in file.
+
+    :param bytes fd: File descriptor
+    :param str root: Array field name inside file
+    :return: Set of indexes of latest releases inside `root` array
+
+    >>> sorted(latest_releases(open('tests/data/ocds-sample-data.json', 'rb'), 'releases'))
+    [5]
+    """
+    prefix = f"{root}.item"
+    ocid_prefix = f"{prefix}.ocid"
+    date_prefix = f"{prefix}.date"
+    latest = {}
+    index = -1
+    ocid = date = None
+    for path, event, value in ijson.parse(fd):
+        if path == ocid_prefix:
+            ocid = value
+        elif path == date_prefix:
+            date = value or ""
+        elif path == prefix:
+            if event == "start_map":
+                index += 1
+                ocid = date = None
+            elif event == "end_map":
+                date = date or ""
+                found = latest.get(ocid)
+                if not found or date >= found[0]:
+                    latest[ocid] = (date, index)
+    return {index for _date, index in latest.values()}
+
+
+def select_items(items, indexes):
+    """Iterate only over items with provided indexes
+
+    >>> list(select_items('abcd', {1, 3}))
+    ['b', 'd']
+    """
+    for index, item in enumerate(items):
+        if index in indexes:
+            yield item
 
 
 def extract_type(item):
@@ -220,6 +346,41 @@ def generate_row_id(ocid, item_id, parent_key=None, top_level_id=None):
     return f"{ocid}/{tail}"
 
 
+def generate_row_key(row_id, abs_path):
+    """Generates stable signed 64-bit integer key for table row
+
+    Key is a hash of rowID and path of the object, so objects without ids in the same array get different keys
+
+    :param str row_id: Generated rowID
+    :param str abs_path: Full path to the object including array indexes
+    :return: Generated rowKey
+    :rtype: int
+
+    >>> generate_row_key('ocid/top/documens:item', '/tender/documents/0')
+    -2344601287549351682
+    """
+    digest = hashlib.blake2b(f"{row_id}|{abs_path}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def cluster_rows(rows, key):
+    """Stable group rows by value of `key` column, groups are ordered by first appearance
+
+    :param rows: List of rows
+    :param key: Grouping column
+    :return: List of rows where rows with the same `key` are contiguous
+
+    >>> cluster_rows([{'p': 1, 'v': 'a'}, {'p': 2, 'v': 'b'}, {'p': 1, 'v': 'c'}], 'p')
+    [{'p': 1, 'v': 'a'}, {'p': 1, 'v': 'c'}, {'p': 2, 'v': 'b'}]
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.get(key), []).append(row)
+    if len(groups) < 2:
+        return rows
+    return list(chain.from_iterable(groups.values()))
+
+
 def recalculate_headers(root, path, abs_path, key, item, should_split, separator="/"):
     """Rebuild table headers when array is expanded with attempt to preserve order
 
@@ -275,11 +436,12 @@ def resolve_file_uri(file_path):
     :param file_path: URI to file, could be url or path
     :return: Read file as dictionary
     """
-    if isinstance(file_path, (str, Path)):
-        with codecs.open(file_path, encoding="utf-8") as fd:
-            return json.load(fd)
-    if file_path.startswith("http"):
-        return requests.get(file_path).json()
+    if str(file_path).startswith(("http://", "https://")):
+        response = requests.get(file_path, timeout=60)
+        response.raise_for_status()
+        return response.json()
+    with codecs.open(file_path, encoding="utf-8") as fd:
+        return json.load(fd)
 
 
 def read_lines(path):
@@ -1,4 +1,21 @@
+from .background import BackgroundWriter
+from .column_stats import ColumnStatsWriter
 from .csv import CSVWriter
+from .parquet import ParquetWriter
+from .partitioned import HashPartitionedWriter
+from .postgres import PostgresCopyWriter
+from .sqlite import SQLiteWriter
 from .xlsx import XlsxWriter
+from .xlsx_parallel import ParallelXlsxWriter
 
-__all__ = ["CSVWriter", "XlsxWriter"]
+__all__ = [
+    "BackgroundWriter",
+    "CSVWriter",
+    "ColumnStatsWriter",
+    "HashPartitionedWriter",
+    "ParallelXlsxWriter",
+    "ParquetWriter",
+    "PostgresCopyWriter",
+    "SQLiteWriter",
+    "XlsxWriter",
+]
@@ -0,0 +1,127 @@
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+
+from spoonbill.i18n import _
+
+LOGGER = logging.getLogger("spoonbill")
+
+QUEUE_SIZE = 64
+BATCH_SIZE = 1000
+
+
+@dataclass
+class WriterStats:
+    """Background writer metrics
+
+    :param batches: Number of batches passed through queue
+    :param rows: Number of rows passed through queue
+    :param max_depth: Maximum number of batches waiting in queue
+    :param producer_stall: Seconds flattening waited for free place in queue
+    :param consumer_idle: Seconds writer thread waited for new batches
+    :param write_time: Seconds spent inside writers
+    """
+
+    batches: int = 0
+    rows: int = 0
+    max_depth: int = 0
+    producer_stall: float = 0.0
+    consumer_idle: float = 0.0
+    write_time: float = 0.0
+
+    @property
+    def bottleneck(self):
+        """Name of the stage which waited less for the other one"""
+        return "writing" if self.producer_stall > self.consumer_idle else "flattening"
+
+
+class BackgroundWriter:
+    """Writer proxy which passes rows to other writers running in separate thread
+
+    Rows are collected into batches and sent through bounded queue, so flattening
+    waits for writers only when queue is full.
+
+    :param writers: Opened writers to pass rows to
+    :param queue_size: Maximum number of batches waiting to be written
+    :param batch_size: Number of rows in a single batch
+    """
+
+    name = "background"
+
+    def __init__(self, writers, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE):
+        self.writers = writers
+        self.batch_size = batch_size
+        self.stats = WriterStats()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._batch = []
+        self._batch_rows = 0
+        self._error = None
+        self._thread = threading.Thread(target=self._consume, name="spoonbill-writer", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        try:
+            self._flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+        if self._error:
+            raise self._error
+
+    def _put(self, batch):
+        if self._error:
+            raise self._error
+        start = time.perf_counter()
+        self._queue.put(batch)
+        self.stats.producer_stall += time.perf_counter() - start
+        self.stats.max_depth = max(self.stats.max_depth, self._queue.qsize())
+
+    def _flush(self):
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self._batch_rows = 0
+            self._put(batch)
+
+    def _consume(self):
+        stats = self.stats
+        while True:
+            start = time.perf_counter()
+            batch = self._queue.get()
+            stats.consumer_idle += time.perf_counter() - start
+            if batch is None:
+                return
+            if self._error:
+                # keep draining queue, so producer is never blocked
+                continue
+            start = time.perf_counter()
+            try:
+                for table, rows in batch:
+                    for writer in self.writers:
+                        writer.writerows(table, rows)
+            except Exception as err:
+                LOGGER.error(_("Background writer failed with error {}").format(err))
+                self._error = err
+            stats.write_time += time.perf_counter() - start
+            stats.batches += 1
+            stats.rows += sum(len(rows) for _table, rows in batch)
+
+    @property
+    def depth(self):
+        """Current number of batches waiting in queue"""
+        return self._queue.qsize()
+
+    def writerow(self, table, row):
+        """Queue row to be written"""
+        self.writerows(table, [row])
+
+    def writerows(self, table, rows):
+        """Queue rows to be written"""
+        self._batch.append((table, rows))
+        self._batch_rows += len(rows)
+        if self._batch_rows >= self.batch_size:
+            self._flush()
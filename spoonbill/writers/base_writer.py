@@ -1,5 +1,42 @@
+import logging
 from collections import defaultdict
 
+from spoonbill.common import JOINABLE
+from spoonbill.i18n import _
+
+LOGGER = logging.getLogger("spoonbill")
+
+JSON_TYPES = ("string", "integer", "number", "boolean")
+
+
+def column_type(column):
+    """Reduce analyzed column type to a single json type
+
+    :param column: Column object
+    :return: One of string, integer, number, boolean or empty string if type is mixed or unknown
+
+    >>> from spoonbill.spec import Column
+    >>> column_type(Column('', ['string', 'null'], '/tender/id'))
+    'string'
+    >>> column_type(Column('', ['integer', 'number'], '/tender/value/amount'))
+    'number'
+    >>> column_type(Column('', 'joinable', '/tender/submissionMethod'))
+    'string'
+    >>> column_type(Column('', 'N/A', '/tender/extra'))
+    ''
+    """
+    types = column.type
+    if isinstance(types, str):
+        if types == JOINABLE or types.startswith("array"):
+            return "string"
+        types = [types]
+    types = set(types) - {"null"}
+    if len(types) == 1 and types <= set(JSON_TYPES):
+        return types.pop()
+    if types and types <= {"integer", "number"}:
+        return "number"
+    return ""
+
 
 class BaseWriter:
     def __init__(self, workdir, tables, options):
@@ -13,6 +50,7 @@ class BaseWriter:
         self.options = options
         self.names = {}
         self.headers = {}
+        self.types = {}
         self.names_counter = defaultdict(int)
 
     def get_headers(self, table, options):
@@ -33,6 +71,19 @@ class BaseWriter:
                 headers[c] = h
         return headers
 
+    def get_types(self, table, headers):
+        """Find json type of every output column
+
+        :param table: Target table
+        :param headers: Table headers
+        :return: Mapping between column and its json type
+        """
+        types = {}
+        for col in headers:
+            column = table.columns.get(col) or table.combined_columns.get(col)
+            types[col] = column_type(column) if column else ""
+        return types
+
     def _name_check(self, table_name):
         self.names_counter[table_name] += 1
         if self.names_counter[table_name] > 1:
@@ -49,5 +100,50 @@ class BaseWriter:
         """
         options = self.options.selection[name]
         self.headers[name] = self.get_headers(table, options)
+        self.types[name] = self.get_types(table, self.headers[name])
         self.names[name] = self._name_check(options.name or name)
         return self.names[name], self.headers[name]
+
+    def valid_rows(self, table, rows):
+        """Filter out rows which can't be written to `table`
+
+        Unknown table and rows with columns missing from table headers are reported as errors.
+
+        :param table: Table name
+        :param rows: List of rows
+        :return: List of rows with known columns only, empty if table is unknown
+        """
+        headers = self.headers.get(table)
+        if headers is None:
+            LOGGER.error(_("Invalid table {}").format(table))
+            return []
+        valid = []
+        for row in rows:
+            invalid = row.keys() - headers
+            if invalid:
+                wrong = ", ".join([repr(col) for col in invalid])
+                err = f"dict contains fields not in fieldnames: {wrong}"
+                LOGGER.error(
+                    _("Operation produced invalid path. This a software bug, please send issue to developers")
+                )
+                LOGGER.error(_("Failed to write row {} with error {}").format(row.get("rowID"), err))
+                continue
+            valid.append(row)
+        return valid
+
+    def writerow(self, table, row):
+        """Write single row to output
+
+        :param table: Table name
+        :param row: Row as mapping between column and value
+        """
+        raise NotImplementedError
+
+    def writerows(self, table, rows):
+        """Write batch of rows of the same table to output
+
+        :param table: Table name
+        :param rows: List of rows
+        """
+        for row in rows:
+            self.writerow(table, row)
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import logging
+import math
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from spoonbill.i18n import _
+from spoonbill.writers.base_writer import BaseWriter
+
+LOGGER = logging.getLogger("spoonbill")
+
+STATS_FILENAME = "stats.json"
+# 4096 registers per column, standard error of distinct estimate is about 1.6%
+PRECISION = 12
+NUMBERS = (int, float, Decimal)
+
+
+class HyperLogLog:
+    """HyperLogLog sketch estimating number of distinct values
+
+    Sketches with the same precision can be merged, e.g. to combine statistics of separate exports.
+
+    >>> sketch = HyperLogLog()
+    >>> for i in range(10000):
+    ...     sketch.add(i % 1000)
+    >>> abs(sketch.count() - 1000) < 50
+    True
+
+    :param precision: Number of bits used to select register
+    """
+
+    def __init__(self, precision=PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        """Add value to sketch"""
+        digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+        x = int.from_bytes(digest, "big")
+        bits = 64 - self.precision
+        index = x >> bits
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Merge other sketch into this one"""
+        if other.precision != self.precision:
+            raise ValueError(_("Can't merge sketches with different precision"))
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """Estimated number of distinct values"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if zeros and estimate <= 2.5 * m:
+            # linear counting is more precise for small cardinalities
+            return round(m * math.log(m / zeros))
+        return round(estimate)
+
+
+@dataclass
+class ColumnStats:
+    """Statistics of single output column
+
+    :param values: Number of non empty values
+    :param min: Minimal value, numbers are compared numerically, other values as strings
+    :param max: Maximal value
+    :param max_length: Maximal length of string values
+    :param distinct: Sketch of distinct values
+    """
+
+    values: int = 0
+    min: object = None
+    max: object = None
+    max_length: int = 0
+    distinct: HyperLogLog = field(default_factory=HyperLogLog)
+
+    def add(self, value):
+        """Add non empty value to statistics"""
+        self.values += 1
+        self.distinct.add(value)
+        cls = value.__class__
+        if cls is str:
+            if len(value) > self.max_length:
+                self.max_length = len(value)
+        elif cls not in NUMBERS:
+            value = str(value)
+        self._update_range(value)
+
+    def _update_range(self, value):
+        if self.min is None:
+            self.min = self.max = value
+            return
+        if (value.__class__ is str) != (self.min.__class__ is str):
+            # numbers take precedence over strings in columns with mixed types
+            if value.__class__ is str:
+                return
+            self.min = self.max = value
+            return
+        if value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Merge statistics of the same column collected separately"""
+        self.values += other.values
+        self.max_length = max(self.max_length, other.max_length)
+        self.distinct.merge(other.distinct)
+        for value in (other.min, other.max):
+            if value is not None:
+                self._update_range(value)
+
+    def as_dict(self, rows):
+        """Statistics as json serializable mapping
+
+        :param rows: Total number of rows in table
+        """
+        return {
+            "nulls": rows - self.values,
+            "distinct": self.distinct.count(),
+            "min": float(self.min) if self.min.__class__ is Decimal else self.min,
+            "max": float(self.max) if self.max.__class__ is Decimal else self.max,
+            "max_length": self.max_length,
+        }
+
+
+class ColumnStatsWriter(BaseWriter):
+    """Writer class collecting statistics of every output column instead of writing rows
+
+    On exit `stats.json` with number of rows in every table and number of nulls, estimated number
+    of distinct values, minimal and maximal value and maximal string length of every column is written.
+    Columns are named by their output headers.
+
+    :param workdir: Working directory
+    :param tables: Tables data
+    :options: Flattening options
+    :param filename: Statistics filename
+    :param stream: Writable binary stream, statistics are written to it instead of file in `workdir`
+    """
+
+    name = "stats"
+
+    def __init__(self, workdir, tables, options, filename=STATS_FILENAME, stream=None):
+        super().__init__(workdir, tables, options)
+        self.path = workdir / filename
+        self.stream = stream
+        self.rows = {}
+        self.stats = {}
+
+    def __enter__(self):
+        for name, table in self.tables.items():
+            self.init_sheet(name, table)
+            self.rows[name] = 0
+            self.stats[name] = {col: ColumnStats() for col in self.headers[name]}
+        return self
+
+    def __exit__(self, *args):
+        self.write()
+
+    def as_dict(self):
+        """Statistics of all tables as json serializable mapping"""
+        return {
+            "tables": {
+                self.names[name]: {
+                    "rows": self.rows[name],
+                    "columns": {
+                        self.headers[name][col]: {"type": self.types[name][col], **stats.as_dict(self.rows[name])}
+                        for col, stats in self.stats[name].items()
+                    },
+                }
+                for name in self.stats
+            }
+        }
+
+    def write(self):
+        """Write statistics to json file"""
+        if self.stream:
+            self.stream.write(json.dumps(self.as_dict(), indent=2).encode("utf-8"))
+            self.stream.flush()
+            return
+        LOGGER.info(_("Dumping column statistics to file '{}'").format(self.path))
+        with open(self.path, "w") as fd:
+            json.dump(self.as_dict(), fd, indent=2)
+
+    def writerow(self, table, row):
+        """Add row to statistics"""
+        self.writerows(table, [row])
+
+    def writerows(self, table, rows):
+        """Add rows to statistics, rows skipped by other writers are skipped as well"""
+        rows = self.valid_rows(table, rows)
+        if not rows:
+            return
+        stats = self.stats[table]
+        self.rows[table] += len(rows)
+        for row in rows:
+            for col, value in row.items():
+                if value is None or value == "":
+                    continue
+                stats[col].add(value)
@@ -0,0 +1,104 @@
+import gzip
+import io
+import logging
+import lzma
+from collections import deque
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+from spoonbill.i18n import _
+
+LOGGER = logging.getLogger("spoonbill")
+
+# codec name and extension of compressed files
+CODECS = {"gzip": ".gz", "xz": ".xz", "zstd": ".zst"}
+
+
+def compress_block(codec, data, level=None):
+    """Compress block of data into self-contained gzip member, xz stream or zstd frame
+
+    Concatenation of such blocks is valid compressed file for standard tools.
+
+    >>> gzip.decompress(compress_block("gzip", b"a") + compress_block("gzip", b"b"))
+    b'ab'
+
+    :param codec: Codec name, one of `CODECS`
+    :param data: Bytes to compress
+    :param level: Compression level, codec default if not set
+    """
+    if codec == "gzip":
+        # gzip.compress accepts mtime only since python 3.8
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=6 if level is None else level, mtime=0) as fd:
+            fd.write(data)
+        return buffer.getvalue()
+    if codec == "xz":
+        return lzma.compress(data, format=lzma.FORMAT_XZ, preset=level)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    raise ValueError(_("Unsupported compression {}").format(codec))
+
+
+def check_codec(codec):
+    """Make sure `codec` can be used for compression"""
+    if codec not in CODECS:
+        raise ValueError(_("Unsupported compression {}").format(codec))
+    if codec == "zstd" and zstandard is None:
+        raise ValueError(_("zstd compression requires zstandard package to be installed"))
+
+
+class CompressedStream(io.RawIOBase):
+    """Binary stream compressing written data in independent blocks
+
+    Full blocks are compressed by `executor` while writing continues, results are written
+    to underlying file in original order.
+
+    :param fd: Underlying binary file
+    :param codec: Codec name, one of `CODECS`
+    :param executor: Executor running compression, e.g. `ThreadPoolExecutor`
+    :param block_size: Size of uncompressed block
+    :param level: Compression level
+    :param max_pending: Maximum number of blocks being compressed at once
+    """
+
+    def __init__(self, fd, codec, executor, block_size, level=None, max_pending=4):
+        super().__init__()
+        check_codec(codec)
+        self.fd = fd
+        self.codec = codec
+        self.executor = executor
+        self.level = level
+        self.block_size = block_size
+        self.max_pending = max_pending
+        self._block = bytearray()
+        self._pending = deque()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._block += data
+        if len(self._block) >= self.block_size:
+            self._submit()
+        return len(data)
+
+    def _submit(self):
+        block, self._block = bytes(self._block), bytearray()
+        self._pending.append(self.executor.submit(compress_block, self.codec, block, self.level))
+        while len(self._pending) > self.max_pending:
+            self.fd.write(self._pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._block:
+                self._submit()
+            while self._pending:
+                self.fd.write(self._pending.popleft().result())
+        finally:
+            self.fd.close()
+            super().close()
@@ -1,62 +1,352 @@
 import csv
+import io
+import json
 import logging
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
 
 from spoonbill.i18n import _
 from spoonbill.writers.base_writer import BaseWriter
+from spoonbill.writers.compression import CODECS, CompressedStream, check_codec
 
 LOGGER = logging.getLogger("spoonbill")
 
+MAX_OPEN_FILES = 256
+BUFFER_SIZE = 1024 * 1024
+MANIFEST_FILENAME = "manifest.json"
+# number of index entries kept in memory before appending them to index file
+INDEX_BUFFER_ENTRIES = 10000
+
+
+class CountingStream(io.RawIOBase):
+    """Binary stream passing data to `fd` and counting written bytes in `counters[key]`"""
+
+    def __init__(self, fd, counters, key):
+        super().__init__()
+        self.fd = fd
+        self.counters = counters
+        self.key = key
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.fd.write(data)
+        self.counters[self.key] += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.fd.close()
+            super().close()
+
+
+class KeepOpenStream(io.RawIOBase):
+    """Binary stream passing data to `fd`, which is flushed but left open when this stream is closed"""
+
+    def __init__(self, fd):
+        super().__init__()
+        self.fd = fd
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.fd.write(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.fd.flush()
+            super().close()
+
 
 class CSVWriter(BaseWriter):
     """Writer class with output to csv files
     For each table will be created corresponding csv file
+
+    At most `max_open` files are kept open, least recently written files are closed
+    and reopened in append mode when needed again.
+    With `compression` set, files are compressed in blocks by `compression_workers` threads,
+    output is a sequence of complete gzip members, xz streams or zstd frames readable by standard tools.
+    With `max_rows` or `max_bytes` set, every table is written into numbered parts `<table>-00001.csv` etc.,
+    each with its own headers, and `manifest.json` listing all parts is written on exit.
+    Parts are switched once limit is reached, so a part may exceed `max_bytes` by the last written batch.
+    With `cluster` flattening option, `<table>.index.jsonl` is written next to every table with an entry for every
+    contiguous run of rows with the same `ocid`, release `id` and parent: file, byte offset and size of the run
+    in uncompressed data, first row number and number of rows. Parent ids repeat in every release of an ocid,
+    so runs are per release and rows of one parent from different releases get separate entries.
+    With `open_stream` set, every table is written into binary stream returned for its file name instead of file
+    in `workdir`, e.g. `io.BytesIO` object or HTTP response body. Streams are flushed but never closed.
+
     :param workdir: Working directory
     :param tables: Tables data
     :options: Flattening options
+    :param max_open: Maximum number of simultaneously open files
+    :param buffering: Write buffer size in bytes, either single value or mapping between table and its buffer size
+    :param compression: Compression codec, one of `gzip`, `xz` or `zstd`
+    :param compression_level: Compression level, codec default if not set
+    :param compression_workers: Number of compression threads
+    :param max_rows: Maximum number of rows in single part, excluding headers
+    :param max_bytes: Maximum number of uncompressed bytes in single part
+    :param open_stream: Callable returning writable binary stream for output file name
     """
 
     name = "csv"
 
-    def __init__(self, workdir, tables, options):
+    def __init__(
+        self,
+        workdir,
+        tables,
+        options,
+        max_open=MAX_OPEN_FILES,
+        buffering=BUFFER_SIZE,
+        compression=None,
+        compression_level=None,
+        compression_workers=None,
+        max_rows=None,
+        max_bytes=None,
+        open_stream=None,
+    ):
         super().__init__(workdir, tables, options)
-        self.writers = {}
-        self.fds = []
+        if compression:
+            check_codec(compression)
+        self.compression = compression
+        self.compression_level = compression_level
+        self.compression_workers = compression_workers
+        self.extension = ".csv" + CODECS.get(compression, "")
+        self.executor = None
+        self.max_open = max_open
+        self.buffering = buffering
+        self.files = {}
+        # open writers in order from least to most recently used
+        self.writers = OrderedDict()
+        self.fds = {}
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.partitioned = bool(max_rows or max_bytes)
+        # written parts of every table as [{"path", "rows"}]
+        self.parts = defaultdict(list)
+        self.part_bytes = defaultdict(int)
+        self.indexed = bool(getattr(options, "cluster", False))
+        # current run of rows and index entries waiting to be written for every table
+        self.index_runs = {}
+        self.index_entries = defaultdict(list)
+        self.open_stream = open_stream
+        self.streams = {}
+        if open_stream and (self.partitioned or self.indexed):
+            raise ValueError(_("Csv output to streams can't be split into parts or indexed"))
+
+    def _buffer_size(self, name):
+        if isinstance(self.buffering, int):
+            return self.buffering
+        return self.buffering.get(name, BUFFER_SIZE)
+
+    def _open(self, name, mode):
+        path = self.files[name]
+        while self.fds and len(self.fds) >= self.max_open:
+            oldest, _writer = self.writers.popitem(last=False)
+            self.fds.pop(oldest).close()
+        try:
+            if name in self.streams or self.compression or self.max_bytes or self.indexed:
+                if name in self.streams:
+                    stream = KeepOpenStream(self.streams[name])
+                else:
+                    stream = open(path, mode + "b", buffering=self._buffer_size(name))
+                if self.compression:
+                    stream = CompressedStream(
+                        stream,
+                        self.compression,
+                        self.executor,
+                        level=self.compression_level,
+                        block_size=self._buffer_size(name),
+                    )
+                if self.max_bytes or self.indexed:
+                    stream = CountingStream(stream, self.part_bytes, name)
+                fd = io.TextIOWrapper(stream)
+            else:
+                fd = open(path, mode, buffering=self._buffer_size(name))
+        except (IOError, OSError) as e:
+            LOGGER.error(_("Failed to open file {} with error {}").format(path, e))
+            return None
+        # rows are validated in writerows
+        writer = csv.DictWriter(fd, self.headers[name], extrasaction="ignore")
+        self.fds[name] = fd
+        self.writers[name] = writer
+        return writer
+
+    def _get_writer(self, name):
+        writer = self.writers.get(name)
+        if writer is not None:
+            self.writers.move_to_end(name)
+            return writer
+        return self._open(name, "a")
+
+    def _start_file(self, name):
+        table_name = self.names[name]
+        if self.partitioned:
+            table_name = f"{table_name}-{len(self.parts[name]) + 1:05d}"
+        path = self.workdir / f"{table_name}{self.extension}"
+        LOGGER.info(_("Dumping table '{}' to file '{}'").format(table_name, path))
+        self.files[name] = path
+        self.part_bytes[name] = 0
+        if self.open_stream:
+            self.streams[name] = self.open_stream(path.name)
+        writer = self._open(name, "w")
+        if writer is None:
+            del self.files[name]
+            return
+        self.parts[name].append({"path": path, "rows": 0})
+        try:
+            writer.writerow(self.headers[name])
+        except ValueError as err:
+            LOGGER.error(_("Failed to headers with error {}").format(err))
+        if self.indexed:
+            # offsets of rows start after headers
+            self.fds[name].flush()
+
+    def _next_part(self, name):
+        self._end_run(name)
+        if name in self.fds:
+            del self.writers[name]
+            self.fds.pop(name).close()
+        self._start_file(name)
+
+    def _part_full(self, name):
+        if self.max_rows and self.parts[name][-1]["rows"] >= self.max_rows:
+            return True
+        return bool(self.max_bytes and self.part_bytes[name] >= self.max_bytes)
 
     def __enter__(self):
         """Write headers to output file"""
+        if self.compression:
+            self.executor = ThreadPoolExecutor(self.compression_workers, thread_name_prefix="spoonbill-compress")
         for name, table in self.tables.items():
-            table_name, headers = self.init_sheet(name, table)
-
-            try:
-                path = self.workdir / f"{table_name}.csv"
-                LOGGER.info(_("Dumping table '{}' to file '{}'").format(table_name, path))
-                fd = open(path, "w")
-            except (IOError, OSError) as e:
-                LOGGER.error(_("Failed to open file {} with error {}").format(path, e))
-                return
-            writer = csv.DictWriter(fd, headers)
-            self.fds.append(fd)
-            self.writers[name] = writer
-
-        for name, writer in self.writers.items():
-            headers = self.headers[name]
-            try:
-                writer.writerow(headers)
-            except ValueError as err:
-                LOGGER.error(_("Failed to headers with error {}").format(err))
+            self.init_sheet(name, table)
+            self._start_file(name)
+            if self.indexed:
+                open(self.index_path(name), "w").close()
         return self
 
     def __exit__(self, *args):
-        for fd in self.fds:
+        for fd in self.fds.values():
             fd.close()
+        self.fds.clear()
+        self.writers.clear()
+        if self.executor:
+            self.executor.shutdown()
+        if self.partitioned:
+            self.write_manifest()
+        for name in list(self.index_runs):
+            self._end_run(name)
+        for name in list(self.index_entries):
+            self._flush_index(name)
+
+    def index_path(self, name):
+        """Path to index file of table `name`"""
+        return self.workdir / f"{self.names[name]}.index.jsonl"
+
+    def _flush_index(self, name):
+        entries = self.index_entries.pop(name, None)
+        if entries:
+            with open(self.index_path(name), "a") as fd:
+                fd.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+    def _end_run(self, name):
+        run = self.index_runs.pop(name, None)
+        if run:
+            entries = self.index_entries[name]
+            entries.append(run[1])
+            if len(entries) >= INDEX_BUFFER_ENTRIES:
+                self._flush_index(name)
+
+    def _write_indexed(self, name, writer, rows):
+        fd = self.fds[name]
+        part = self.parts[name][-1]
+        start = part["rows"]
+        parent = None if self.tables[name].is_root else self.options.parent_column
+        for key, run in groupby(rows, key=lambda row: (row.get("ocid"), row.get("id"), row.get(parent))):
+            run = list(run)
+            offset = self.part_bytes[name]
+            writer.writerows(run)
+            fd.flush()
+            current = self.index_runs.get(name)
+            if current and current[0] == key:
+                entry = current[1]
+                entry["bytes"] = self.part_bytes[name] - entry["offset"]
+                entry["rows"] += len(run)
+            else:
+                self._end_run(name)
+                entry = {"ocid": key[0], "id": key[1]}
+                if parent:
+                    entry[parent] = key[2]
+                entry.update(
+                    {
+                        "file": part["path"].name,
+                        "offset": offset,
+                        "bytes": self.part_bytes[name] - offset,
+                        "start": start,
+                        "rows": len(run),
+                    }
+                )
+                self.index_runs[name] = (key, entry)
+            start += len(run)
+
+    def write_manifest(self):
+        """Write `manifest.json` listing parts of every table with their number of rows and size"""
+        manifest = {
+            "tables": {
+                self.names[name]: [
+                    {"file": part["path"].name, "rows": part["rows"], "bytes": part["path"].stat().st_size}
+                    for part in parts
+                ]
+                for name, parts in self.parts.items()
+            }
+        }
+        path = self.workdir / MANIFEST_FILENAME
+        LOGGER.info(_("Dumping list of csv parts to file '{}'").format(path))
+        with open(path, "w") as fd:
+            json.dump(manifest, fd, indent=2)
 
     def writerow(self, table, row):
         """Write row to output file"""
-        try:
-            self.writers[table].writerow(row)
-        except ValueError as err:
-            LOGGER.error(_("Operation produced invalid path. This a software bug, please send issue to developers"))
-            LOGGER.error(_("Failed to write row {} with error {}").format(row.get("rowID"), err))
-        except KeyError:
-            LOGGER.error(_("Invalid table {}").format(table))
+        self.writerows(table, [row])
+
+    def writerows(self, table, rows):
+        """Write rows to output file"""
+        rows = self.valid_rows(table, rows)
+        if table not in self.files:
+            return
+        if not self.partitioned:
+            writer = self._get_writer(table)
+            if writer is None:
+                return
+            if self.indexed:
+                self._write_indexed(table, writer, rows)
+                self.parts[table][-1]["rows"] += len(rows)
+            else:
+                writer.writerows(rows)
+            return
+        while rows:
+            if self._part_full(table):
+                self._next_part(table)
+                if table not in self.files:
+                    return
+            part = self.parts[table][-1]
+            if self.max_rows:
+                free = self.max_rows - part["rows"]
+                chunk, rows = rows[:free], rows[free:]
+            else:
+                chunk, rows = rows, []
+            writer = self._get_writer(table)
+            if writer is None:
+                return
+            if self.indexed:
+                self._write_indexed(table, writer, chunk)
+            else:
+                writer.writerows(chunk)
+            part["rows"] += len(chunk)
+            if self.max_bytes:
+                # pass pending text down to byte counter
+                self.fds[table].flush()
@@ -0,0 +1,151 @@
+import logging
+from decimal import Decimal
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+from spoonbill.i18n import _
+from spoonbill.writers.base_writer import BaseWriter
+from spoonbill.writers.sql import unique_column_names
+
+LOGGER = logging.getLogger("spoonbill")
+
+ROW_GROUP_SIZE = 65536
+# codelist fields with few distinct values, stored as dictionary columns
+ENUM_FIELDS = {
+    "awardCriteria",
+    "currency",
+    "mainProcurementCategory",
+    "procurementCategory",
+    "procurementMethod",
+    "scheme",
+    "status",
+    "submissionMethod",
+    "type",
+}
+
+
+def arrow_type(json_type, path):
+    """Select arrow type for column
+
+    :param json_type: Column json type
+    :param path: Column path
+    """
+    if json_type == "integer":
+        return pyarrow.int64()
+    if json_type == "number":
+        return pyarrow.float64()
+    if json_type == "boolean":
+        return pyarrow.bool_()
+    if path.rsplit("/", 1)[-1] in ENUM_FIELDS:
+        return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+    return pyarrow.string()
+
+
+def coerce(json_type, value):
+    """Convert value to python type of column, None if not possible
+
+    >>> coerce("number", Decimal("1.5"))
+    1.5
+    >>> coerce("integer", "n/a") is None
+    True
+    >>> coerce("string", True)
+    'True'
+    """
+    if value is None:
+        return None
+    cls = value.__class__
+    if json_type == "integer":
+        return value if cls is int else None
+    if json_type == "number":
+        return float(value) if cls in (int, float, Decimal) else None
+    if json_type == "boolean":
+        return value if cls is bool else None
+    return value if cls is str else str(value)
+
+
+class ParquetWriter(BaseWriter):
+    """Writer class with output to parquet files
+    For each table will be created corresponding `<table>.parquet` file
+
+    Rows are buffered per table and written as row groups of `row_group_size` rows,
+    so memory usage is bounded by number of tables. Codelist columns like `status`
+    or `currency` are stored as dictionary columns. Values not matching analyzed
+    column type are written as nulls. Requires `pyarrow`.
+
+    :param workdir: Working directory
+    :param tables: Tables data
+    :options: Flattening options
+    :param row_group_size: Number of rows in single row group
+    :param compression: Parquet compression codec
+    """
+
+    name = "parquet"
+
+    def __init__(self, workdir, tables, options, row_group_size=ROW_GROUP_SIZE, compression="zstd"):
+        if pyarrow is None:
+            raise ImportError(_("Parquet output requires pyarrow package to be installed"))
+        super().__init__(workdir, tables, options)
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.schemas = {}
+        self.files = {}
+        self.writers = {}
+        self.buffers = {}
+
+    def __enter__(self):
+        """Prepare schema of every table"""
+        for name, table in self.tables.items():
+            table_name, headers = self.init_sheet(name, table)
+            columns = unique_column_names(headers)
+            self.schemas[name] = pyarrow.schema(
+                [pyarrow.field(columns[col], arrow_type(self.types[name][col], col)) for col in headers]
+            )
+            self.files[name] = self.workdir / f"{table_name}.parquet"
+            self.buffers[name] = []
+        return self
+
+    def __exit__(self, *args):
+        for name in self.tables:
+            if self.buffers[name] or name not in self.writers:
+                self._flush(name)
+            self.writers[name].close()
+
+    def _column(self, name, col, field, rows):
+        json_type = self.types[name][col]
+        values = [row.get(col) for row in rows]
+        if json_type == "number":
+            values = [float(v) if v.__class__ is Decimal else v for v in values]
+        try:
+            return pyarrow.array(values, type=field.type)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError) as err:
+            LOGGER.error(_("Failed to write column {} to parquet table {} with error {}").format(col, name, err))
+            return pyarrow.array([coerce(json_type, v) for v in values], type=field.type)
+
+    def _flush(self, name):
+        rows, self.buffers[name] = self.buffers[name], []
+        schema = self.schemas[name]
+        arrays = [self._column(name, col, field, rows) for col, field in zip(self.headers[name], schema)]
+        if name not in self.writers:
+            LOGGER.info(_("Dumping table '{}' to file '{}'").format(self.names[name], self.files[name]))
+            self.writers[name] = pyarrow.parquet.ParquetWriter(self.files[name], schema, compression=self.compression)
+        self.writers[name].write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+
+    def writerow(self, table, row):
+        """Write row to output file"""
+        self.writerows(table, [row])
+
+    def writerows(self, table, rows):
+        """Write rows to output file"""
+        rows = self.valid_rows(table, rows)
+        buffer = self.buffers.get(table)
+        if buffer is None:
+            return
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= self.row_group_size:
+                self._flush(table)
+                buffer = self.buffers[table]
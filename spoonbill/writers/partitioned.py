@@ -0,0 +1,109 @@
+import json
+import logging
+import zlib
+from collections import defaultdict
+from contextlib import ExitStack
+from functools import partial
+
+from spoonbill.i18n import _
+from spoonbill.writers.csv import MANIFEST_FILENAME, MAX_OPEN_FILES, CSVWriter
+
+LOGGER = logging.getLogger("spoonbill")
+
+
+def bucket_of(value, buckets):
+    """Stable bucket number of `value`, the same across runs and processes
+
+    >>> bucket_of("ocds-213czf-000-00001", 16)
+    4
+
+    :param value: Partitioning key value
+    :param buckets: Number of buckets
+    """
+    return zlib.crc32(str(value).encode("utf-8")) % buckets
+
+
+class HashPartitionedWriter:
+    """Writer proxy which partitions rows of every table into buckets by hash of `key` column
+
+    Rows are passed to separate writer for every bucket, writing into `bucket-0000`, `bucket-0001` etc.
+    subdirectories of `workdir`, so bucket `i` of all tables holds all rows related to the same ocids.
+    `manifest.json` with number of rows in every bucket is written on exit.
+
+    :param workdir: Working directory
+    :param tables: Tables data
+    :param options: Flattening options
+    :param buckets: Number of buckets
+    :param factory: Callable creating writer from workdir, tables and options, csv writer by default
+    :param key: Column used to select bucket
+    """
+
+    name = "partitioned"
+
+    def __init__(self, workdir, tables, options, buckets, factory=None, key="ocid"):
+        self.workdir = workdir
+        self.tables = tables
+        self.options = options
+        self.buckets = buckets
+        self.key = key
+        # keep total number of open files within limit of single csv writer
+        self.factory = factory or partial(CSVWriter, max_open=max(1, MAX_OPEN_FILES // buckets))
+        self.writers = []
+        self.rows = defaultdict(lambda: [0] * buckets)
+        self._stack = ExitStack()
+
+    def bucket_dir(self, bucket):
+        """Directory of bucket with number `bucket`"""
+        return self.workdir / f"bucket-{bucket:04d}"
+
+    def __enter__(self):
+        with ExitStack() as stack:
+            for bucket in range(self.buckets):
+                path = self.bucket_dir(bucket)
+                path.mkdir(parents=True, exist_ok=True)
+                self.writers.append(stack.enter_context(self.factory(path, self.tables, self.options)))
+            self._stack = stack.pop_all()
+        return self
+
+    def __exit__(self, *args):
+        try:
+            self._stack.__exit__(*args)
+        finally:
+            self.write_manifest()
+
+    def _file_name(self, name):
+        if self.writers:
+            return self.writers[0].names.get(name, name)
+        return name
+
+    def write_manifest(self):
+        """Write `manifest.json` with bucket directories and number of rows in every bucket"""
+        manifest = {
+            "key": self.key,
+            "hash": "crc32",
+            "buckets": [self.bucket_dir(bucket).name for bucket in range(self.buckets)],
+            "tables": {self._file_name(name): self.rows[name] for name in self.tables},
+        }
+        path = self.workdir / MANIFEST_FILENAME
+        LOGGER.info(_("Dumping list of buckets to file '{}'").format(path))
+        with open(path, "w") as fd:
+            json.dump(manifest, fd, indent=2)
+
+    def writerow(self, table, row):
+        """Write row to its bucket"""
+        self.writerows(table, [row])
+
+    def writerows(self, table, rows):
+        """Write rows to their buckets"""
+        batches = defaultdict(list)
+        last_value, last_bucket = None, None
+        for row in rows:
+            value = row.get(self.key, "")
+            # rows of the same release usually come together
+            if value != last_value:
+                last_value, last_bucket = value, bucket_of(value, self.buckets)
+            batches[last_bucket].append(row)
+        counts = self.rows[table]
+        for bucket, batch in batches.items():
+            self.writers[bucket].writerows(table, batch)
+            counts[bucket] += len(batch)
@@ -0,0 +1,253 @@
+import logging
+import struct
+from decimal import Decimal
+
+from spoonbill.i18n import _
+from spoonbill.writers.base_writer import BaseWriter
+from spoonbill.writers.sql import INDEXED_COLUMNS, quote, unique_column_names
+
+LOGGER = logging.getLogger("spoonbill")
+
+PG_TYPES = {"string": "text", "integer": "bigint", "number": "numeric", "boolean": "boolean", "": "text"}
+FORMATS = {"text": ".copy", "binary": ".bin"}
+# postgres truncates longer identifiers
+NAME_LENGTH = 63
+BUFFER_SIZE = 1024 * 1024
+SCRIPT_FILENAME = "load.sql"
+
+BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+BINARY_TRAILER = struct.pack(">h", -1)
+TEXT_NULL = "\\N"
+TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+NUMERIC_NEG = 0x4000
+NUMERIC_NAN = 0xC000
+
+
+def encode_numeric(value):
+    """Encode number in postgres binary `numeric` format
+
+    >>> encode_numeric(Decimal("10.5")).hex()
+    '0002000000000001000a1388'
+
+    :param value: int, float or Decimal
+    :return: Bytes of numeric field value
+    """
+    if value.__class__ is float:
+        value = Decimal(repr(value))
+    elif value.__class__ is not Decimal:
+        value = Decimal(value)
+    sign, digits, exponent = value.as_tuple()
+    if exponent in ("n", "N"):
+        return struct.pack(">hhHH", 0, 0, NUMERIC_NAN, 0)
+    if exponent == "F":
+        raise ValueError(_("Infinite numbers are not supported"))
+    dscale = max(0, -exponent)
+    # align decimal point to base 10000 digit boundary
+    pad = exponent % 4
+    digits = list(digits) + [0] * pad
+    exponent -= pad
+    digits = [0] * (-len(digits) % 4) + digits
+    groups = [
+        digits[i] * 1000 + digits[i + 1] * 100 + digits[i + 2] * 10 + digits[i + 3] for i in range(0, len(digits), 4)
+    ]
+    weight = len(groups) - 1 + exponent // 4
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+    return struct.pack(f">hhHH{len(groups)}H", len(groups), weight, NUMERIC_NEG if sign else 0, dscale, *groups)
+
+
+def _check(value, classes, expected):
+    if value.__class__ not in classes:
+        raise ValueError(_("Expected {}, got {!r}").format(expected, value))
+
+
+def text_string(value):
+    return str(value).translate(TEXT_ESCAPES)
+
+
+def text_integer(value):
+    _check(value, (int,), "integer")
+    return str(value)
+
+
+def text_number(value):
+    _check(value, (int, float, Decimal), "number")
+    return str(value)
+
+
+def text_boolean(value):
+    _check(value, (bool,), "boolean")
+    return "t" if value else "f"
+
+
+def binary_string(value):
+    data = str(value).encode("utf-8")
+    return struct.pack(">i", len(data)) + data
+
+
+def binary_integer(value):
+    _check(value, (int,), "integer")
+    return b"\x00\x00\x00\x08" + struct.pack(">q", value)
+
+
+def binary_number(value):
+    _check(value, (int, float, Decimal), "number")
+    data = encode_numeric(value)
+    return struct.pack(">i", len(data)) + data
+
+
+def binary_boolean(value):
+    _check(value, (bool,), "boolean")
+    return b"\x00\x00\x00\x01\x01" if value else b"\x00\x00\x00\x01\x00"
+
+
+# encoders of non null values for every column json type
+ENCODERS = {
+    "text": {"string": text_string, "integer": text_integer, "number": text_number, "boolean": text_boolean},
+    "binary": {"string": binary_string, "integer": binary_integer, "number": binary_number, "boolean": binary_boolean},
+}
+NULLS = {"text": TEXT_NULL, "binary": struct.pack(">i", -1)}
+
+
+def encode_row(encoders, null, row, table):
+    """Encode fields of single row
+
+    Values not matching column type are replaced with NULL.
+
+    >>> encode_row([("/a", text_string), ("/b", text_boolean)], TEXT_NULL, {"/a": "x\\ty", "/b": None}, "t")
+    ['x\\\\ty', '\\\\N']
+
+    :param encoders: Pairs of column and its encoder
+    :param null: Encoded NULL value
+    :param row: Row to encode
+    :param table: Table name
+    """
+    fields = []
+    for col, encode in encoders:
+        value = row.get(col)
+        if value is None:
+            fields.append(null)
+            continue
+        try:
+            fields.append(encode(value))
+        except (ValueError, struct.error) as err:
+            LOGGER.error(_("Failed to write column {} to table {} with error {}").format(col, table, err))
+            fields.append(null)
+    return fields
+
+
+class PostgresCopyWriter(BaseWriter):
+    """Writer class with output to files in postgres COPY format
+    For each table will be created corresponding `<table>.copy` file in text format
+    or `<table>.bin` file in binary format
+
+    `load.sql` psql script creating tables, loading all files with `\\copy` and creating indexes
+    on `rowID`, `parentID`, `ocid` and surrogate key columns is written next to them.
+    Values not matching analyzed column type are written as NULL.
+
+    :param workdir: Working directory
+    :param tables: Tables data
+    :options: Flattening options
+    :param format: COPY format, either `text` or `binary`
+    """
+
+    name = "postgres"
+
+    def __init__(self, workdir, tables, options, format="text"):
+        super().__init__(workdir, tables, options)
+        if format not in FORMATS:
+            raise ValueError(_("Unsupported COPY format {}").format(format))
+        self.format = format
+        self.files = {}
+        self.fds = {}
+        self.columns = {}
+        self._encoders = {}
+
+    def create_table_sql(self, name):
+        """CREATE TABLE statement for table `name`"""
+        definition = ",\n".join(
+            f"    {quote(column_name)} {PG_TYPES[self.types[name][col]]}"
+            for col, column_name in self.columns[name].items()
+        )
+        return f"CREATE TABLE {quote(self.names[name])} (\n{definition}\n);"
+
+    def copy_sql(self, name):
+        """psql `\\copy` command loading file of table `name`"""
+        path = str(self.files[name].name).replace("'", "''")
+        return f"\\copy {quote(self.names[name])} FROM '{path}' WITH (FORMAT {self.format})"
+
+    def index_sql(self, name):
+        """CREATE INDEX statements for table `name`"""
+        table_name = self.names[name]
+        return [
+            f"CREATE INDEX {quote(f'{table_name}_{col}'[:NAME_LENGTH])} "
+            f"ON {quote(table_name)} ({quote(self.columns[name][col])});"
+            for col in INDEXED_COLUMNS
+            if col in self.columns[name]
+        ]
+
+    def write_script(self):
+        """Write psql script loading all tables"""
+        lines = [self.create_table_sql(name) for name in self.fds]
+        lines.extend(self.copy_sql(name) for name in self.fds)
+        for name in self.fds:
+            lines.extend(self.index_sql(name))
+        path = self.workdir / SCRIPT_FILENAME
+        LOGGER.info(_("Dumping postgres load script to file '{}'").format(path))
+        with open(path, "w") as fd:
+            fd.write("\n".join(lines) + "\n")
+
+    def __enter__(self):
+        """Write headers to output files"""
+        for name, table in self.tables.items():
+            table_name, headers = self.init_sheet(name, table)
+            self.columns[name] = unique_column_names(headers, max_length=NAME_LENGTH)
+            types = self.types[name]
+            encoders = ENCODERS[self.format]
+            self._encoders[name] = [(col, encoders.get(types[col], encoders["string"])) for col in headers]
+            path = self.workdir / f"{table_name}{FORMATS[self.format]}"
+            LOGGER.info(_("Dumping table '{}' to file '{}'").format(table_name, path))
+            try:
+                fd = open(path, "wb", buffering=BUFFER_SIZE)
+            except (IOError, OSError) as e:
+                LOGGER.error(_("Failed to open file {} with error {}").format(path, e))
+                continue
+            if self.format == "binary":
+                fd.write(BINARY_HEADER)
+            self.files[name] = path
+            self.fds[name] = fd
+        return self
+
+    def __exit__(self, *args):
+        for fd in self.fds.values():
+            if self.format == "binary":
+                fd.write(BINARY_TRAILER)
+            fd.close()
+        self.write_script()
+
+    def writerow(self, table, row):
+        """Write row to output file"""
+        self.writerows(table, [row])
+
+    def writerows(self, table, rows):
+        """Write rows to output file"""
+        rows = self.valid_rows(table, rows)
+        fd = self.fds.get(table)
+        if fd is None:
+            return
+        columns = self.columns[table]
+        count = struct.pack(">h", len(columns))
+        encoders = self._encoders[table]
+        null = NULLS[self.format]
+        chunks = []
+        for row in rows:
+            if self.format == "binary":
+                chunks.append(count + b"".join(encode_row(encoders, null, row, table)))
+            else:
+                chunks.append(("\t".join(encode_row(encoders, null, row, table)) + "\n").encode("utf-8"))
+        fd.write(b"".join(chunks))
@@ -0,0 +1,40 @@
+INDEXED_COLUMNS = ("rowID", "parentID", "rowKey", "parentKey", "ocid")
+
+
+def quote(name):
+    """Quote sql identifier
+
+    >>> quote('Tender "ID" field')
+    '"Tender ""ID"" field"'
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def unique_column_names(headers, max_length=None):
+    """Make database column names from headers, unique regardless of case
+
+    Pretty headers may repeat, while database columns must be unique.
+
+    >>> unique_column_names({"/a": "ID", "/b": "id", "/c": "Amount"})
+    {'/a': 'ID', '/b': 'id (2)', '/c': 'Amount'}
+
+    :param headers: Mapping between column and its header
+    :param max_length: Maximum length of column name in bytes
+    :return: Mapping between column and database column name
+    """
+    names = {}
+    seen = set()
+    for col, header in headers.items():
+        if max_length:
+            header = header.encode("utf-8")[:max_length].decode("utf-8", "ignore")
+        column_name, index = header, 2
+        while column_name.lower() in seen:
+            suffix = f" ({index})"
+            if max_length:
+                column_name = header.encode("utf-8")[: max_length - len(suffix)].decode("utf-8", "ignore") + suffix
+            else:
+                column_name = header + suffix
+            index += 1
+        seen.add(column_name.lower())
+        names[col] = column_name
+    return names
@@ -0,0 +1,107 @@
+import logging
+import sqlite3
+from decimal import Decimal
+from pathlib import Path
+
+from spoonbill.i18n import _
+from spoonbill.writers.base_writer import BaseWriter
+from spoonbill.writers.sql import INDEXED_COLUMNS, quote, unique_column_names
+
+LOGGER = logging.getLogger("spoonbill")
+
+SQL_TYPES = {"string": "TEXT", "integer": "INTEGER", "number": "REAL", "boolean": "BOOLEAN", "": ""}
+# pragmas trading durability for loading speed, crash during export leaves corrupted database
+FAST_LOAD_PRAGMAS = (
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA locking_mode = EXCLUSIVE",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+)
+COMMIT_ROWS = 500000
+
+
+class SQLiteWriter(BaseWriter):
+    """Writer class with output to sqlite database
+    For each table will be created corresponding database table
+
+    Rows are inserted in large transactions, indexes on `rowID`, `parentID`, `ocid`
+    and surrogate key columns are created once all rows are written.
+
+    :param workdir: Working directory
+    :param tables: Tables data
+    :options: Flattening options
+    :param filename: Database filename
+    :param commit_rows: Number of rows inserted in single transaction
+    """
+
+    name = "sqlite"
+
+    def __init__(self, workdir, tables, options, filename="result.sqlite", commit_rows=COMMIT_ROWS):
+        super().__init__(workdir, tables, options)
+        self.path = Path(workdir / filename)
+        self.commit_rows = commit_rows
+        self.connection = None
+        self.columns = {}
+        self.statements = {}
+        self.rows = 0
+        self._pending = 0
+
+    def __enter__(self):
+        """Create database tables"""
+        if self.path.exists():
+            self.path.unlink()
+        LOGGER.info(_("Dumping all tables to database '{}'").format(self.path))
+        self.connection = sqlite3.connect(self.path, isolation_level=None)
+        for pragma in FAST_LOAD_PRAGMAS:
+            self.connection.execute(pragma)
+        for name, table in self.tables.items():
+            table_name, _headers = self.init_sheet(name, table)
+            self.columns[name] = unique_column_names(self.headers[name])
+            definition = ", ".join(
+                f"{quote(column_name)} {SQL_TYPES[self.types[name][col]]}".strip()
+                for col, column_name in self.columns[name].items()
+            )
+            self.connection.execute(f"CREATE TABLE {quote(table_name)} ({definition})")
+            placeholders = ", ".join("?" * len(self.columns[name]))
+            self.statements[name] = f"INSERT INTO {quote(table_name)} VALUES ({placeholders})"
+        self.connection.execute("BEGIN")
+        return self
+
+    def __exit__(self, *args):
+        try:
+            self.connection.execute("COMMIT")
+            self.create_indexes()
+        finally:
+            self.connection.close()
+
+    def create_indexes(self):
+        """Create indexes on columns used to join tables"""
+        for name, columns in self.columns.items():
+            table_name = self.names[name]
+            for col in INDEXED_COLUMNS:
+                if col not in columns:
+                    continue
+                LOGGER.info(_("Creating index on column {} of table {}").format(col, table_name))
+                self.connection.execute(
+                    f"CREATE INDEX {quote(f'{table_name}_{col}')} ON {quote(table_name)} ({quote(columns[col])})"
+                )
+
+    def writerow(self, table, row):
+        """Write row to database"""
+        self.writerows(table, [row])
+
+    def writerows(self, table, rows):
+        """Write rows to database"""
+        rows = self.valid_rows(table, rows)
+        if not rows:
+            return
+        columns = self.columns[table]
+        values = [tuple(float(v) if v.__class__ is Decimal else v for v in map(row.get, columns)) for row in rows]
+        self.connection.executemany(self.statements[table], values)
+        self.rows += len(values)
+        self._pending += len(values)
+        if self._pending >= self.commit_rows:
+            self.connection.execute("COMMIT")
+            self.connection.execute("BEGIN")
+            self._pending = 0
@@ -1,6 +1,7 @@
 import collections
 import logging
 from collections import defaultdict
+from pathlib import Path
 
 import xlsxwriter
 from xlsxwriter.exceptions import XlsxWriterException
@@ -10,40 +11,179 @@ from spoonbill.writers.base_writer import BaseWriter
 
 LOGGER = logging.getLogger("spoonbill")
 
+# Excel limits
+XLSX_MAX_ROWS = 1048576
+SHEET_NAME_LENGTH = 31
+# inline strings keep every worksheet independent of the others
+WORKBOOK_OPTIONS = {"constant_memory": True, "strings_to_urls": False}
+
+
+def get_cell_writer(sheet, json_type):
+    """Select worksheet method to write cells of column with `json_type`
+
+    Typed methods skip value type dispatch of generic `write`,
+    values not matching column type are still written with generic method.
+
+    :param sheet: Worksheet object
+    :param json_type: Column json type
+    :return: Callable accepting row index, column index and value
+    """
+    if json_type == "string":
+        write = sheet.write_string
+    elif json_type in ("integer", "number"):
+        write = sheet.write_number
+    else:
+        return sheet.write
+    fallback = sheet.write
+
+    def write_cell(row, col, value):
+        try:
+            return write(row, col, value)
+        except (TypeError, ValueError):
+            return fallback(row, col, value)
+
+    return write_cell
+
+
+def init_sheet_columns(sheet, name, headers, types):
+    """Write headers to sheet and prepare cell writers for every column
+
+    :param sheet: Worksheet object
+    :param name: Table name
+    :param headers: Mapping between column and its header
+    :param types: Mapping between column and its json type
+    :return: Mapping between column and its index with cell writer
+    """
+    columns = {}
+    for col_index, col_name in enumerate(headers):
+        columns[col_name] = (col_index, get_cell_writer(sheet, types[col_name]))
+        try:
+            sheet.write(0, col_index, headers[col_name])
+        except XlsxWriterException as err:
+            LOGGER.error(_("Failed to write header {} to xlsx sheet {} with error {}").format(col_name, name, err))
+    return columns
+
+
+def continuation_name(base, names):
+    """Pick name of sheet continuing table `base` which is not yet in `names`
+
+    >>> continuation_name("tenders", {"tenders", "tenders_2"})
+    'tenders_3'
+    """
+    index = 2
+    while True:
+        suffix = f"_{index}"
+        sheet_name = base[: SHEET_NAME_LENGTH - len(suffix)] + suffix
+        if sheet_name not in names:
+            return sheet_name
+        index += 1
+
+
+def write_row(columns, row_index, row, table):
+    """Write single row to sheet
+
+    :param columns: Mapping between column and its index with cell writer
+    :param row_index: Sheet row index
+    :param row: Row to write
+    :param table: Table name
+    :return: False if row contains unknown column
+    """
+    for column, value in row.items():
+        if value.__class__ is bool:
+            value = str(value)
+        try:
+            col_index, write = columns[column]
+        except KeyError:
+            LOGGER.error(_("Operation produced invalid path. This a software bug, please send issue to developers"))
+            LOGGER.error(_("Failed to write column {} to xlsx sheet {}").format(column, table))
+            return False
+        try:
+            write(row_index, col_index, value)
+        except XlsxWriterException as err:
+            LOGGER.error(_("Failed to write column {} to xlsx sheet {} with error {}").format(column, table, err))
+    return True
+
 
 class XlsxWriter(BaseWriter):
     """Writer class with output to xlsx files
     For each table will be created corresponding sheet inside workbook
+
+    Tables longer than sheet row limit continue in sheets named `<table>_2`, `<table>_3` etc.
+    and when `max_workbook_rows` is set, output continues in new workbook `<filename>_2.xlsx` etc.
+    once limit is reached.
+    With `stream` set, workbook is assembled in memory and written into the stream on exit instead of file.
+
     :param workdir: Working directory
     :param tables: Tables data
     :options: Flattening options
+    :param max_rows: Maximum number of rows in single sheet including headers
+    :param max_workbook_rows: Maximum number of rows in single workbook
+    :param stream: Writable binary stream receiving the workbook, e.g. `io.BytesIO`
     """
 
     name = "xlsx"
 
-    def __init__(self, workdir, tables, options, filename="result.xlsx"):
+    def __init__(
+        self,
+        workdir,
+        tables,
+        options,
+        filename="result.xlsx",
+        max_rows=XLSX_MAX_ROWS,
+        max_workbook_rows=None,
+        stream=None,
+    ):
         super().__init__(workdir, tables, options)
+        if stream is not None and max_workbook_rows:
+            raise ValueError(_("Xlsx output to stream can't be split into multiple workbooks"))
+        self.stream = stream
         self.col_index = collections.defaultdict(dict)
-        path = workdir / filename
-        LOGGER.info(_("Dumping all sheets to file to file '{}'").format(path))
-        self.workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        self.cell_writers = collections.defaultdict(dict)
+        self.sheets = {}
+        self.max_rows = max_rows
+        self.max_workbook_rows = max_workbook_rows
+        self.path = Path(workdir / filename)
+        self.paths = []
+        self.continuations = defaultdict(list)
         self.row_counters = {}
+        self.workbook_rows = 0
+        self.workbook = self._open_workbook(self.path)
+
+    def _open_workbook(self, path):
+        LOGGER.info(_("Dumping all sheets to file to file '{}'").format(path))
+        self.paths.append(path)
+        self.workbook_rows = 0
+        self._sheet_names = set()
+        if self.stream is not None:
+            return xlsxwriter.Workbook(self.stream, {**WORKBOOK_OPTIONS, "in_memory": True})
+        return xlsxwriter.Workbook(path, WORKBOOK_OPTIONS)
+
+    def _add_sheet(self, name, sheet_name):
+        sheet = self.workbook.add_worksheet(sheet_name)
+        self._sheet_names.add(sheet_name)
+        self.sheets[name] = sheet
+        self.cell_writers[name] = init_sheet_columns(sheet, name, self.headers[name], self.types[name])
+        self.col_index[name] = {col: index for col, (index, _writer) in self.cell_writers[name].items()}
+        self.row_counters[name] = 1
+
+    def _next_sheet(self, name):
+        sheet_name = continuation_name(self.names[name], self._sheet_names)
+        LOGGER.info(_("Table {} exceeded sheet size, continuing in sheet {}").format(name, sheet_name))
+        self.continuations[name].append(sheet_name)
+        self._add_sheet(name, sheet_name)
+
+    def _next_workbook(self):
+        self.workbook.close()
+        path = self.path.with_name(f"{self.path.stem}_{len(self.paths) + 1}{self.path.suffix}")
+        self.workbook = self._open_workbook(path)
+        for name in self.tables:
+            self._add_sheet(name, self.names[name])
 
     def __enter__(self):
         """Write headers to output file"""
         for name, table in self.tables.items():
-            table_name, headers = self.init_sheet(name, table)
-            sheet = self.workbook.add_worksheet(table_name)
-
-            for col_index, col_name in enumerate(headers):
-                self.col_index[name][col_name] = col_index
-                try:
-                    sheet.write(0, col_index, headers[col_name])
-                except XlsxWriterException as err:
-                    LOGGER.error(
-                        _("Failed to write header {} to xlsx sheet {} with error {}").format(col_name, name, err)
-                    )
-            self.row_counters[name] = 1
+            table_name, _headers = self.init_sheet(name, table)
+            self._add_sheet(name, table_name)
         return self
 
     def __exit__(self, *args):
@@ -51,27 +191,26 @@ class XlsxWriter(BaseWriter):
 
     def writerow(self, table, row):
         """Write row to output file"""
-        table_name = self.names.get(table, table)
-        sheet = self.workbook.get_worksheet_by_name(table_name)
-        columns = self.col_index[table]
+        self.writerows(table, [row])
+
+    def writerows(self, table, rows):
+        """Write rows to output file"""
+        columns = self.cell_writers.get(table)
         if not columns:
             LOGGER.error(_("Invalid table {}").format(table))
             return
 
-        for column, value in row.items():
-            if isinstance(value, bool):
-                value = str(value)
-            try:
-                col_index = columns[column]
-            except KeyError:
-                LOGGER.error(
-                    _("Operation produced invalid path. This a software bug, please send issue to developers")
-                )
-                LOGGER.error(_("Failed to write column {} to xlsx sheet {}").format(column, table))
-                return
-            try:
-                sheet.write(self.row_counters[table], col_index, value)
-            except XlsxWriterException as err:
-                LOGGER.error(_("Failed to write column {} to xlsx sheet {} with error {}").format(column, table, err))
-
-        self.row_counters[table] += 1
+        row_index = self.row_counters[table]
+        for row in rows:
+            if self.max_workbook_rows and self.workbook_rows >= self.max_workbook_rows:
+                self._next_workbook()
+                row_index = self.row_counters[table]
+                columns = self.cell_writers[table]
+            if row_index >= self.max_rows:
+                self._next_sheet(table)
+                row_index = self.row_counters[table]
+                columns = self.cell_writers[table]
+            if write_row(columns, row_index, row, table):
+                row_index += 1
+                self.workbook_rows += 1
+        self.row_counters[table] = row_index
@@ -0,0 +1,175 @@
+import logging
+import pickle
+import shutil
+import tempfile
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import xlsxwriter
+
+from spoonbill.i18n import _
+from spoonbill.writers.base_writer import BaseWriter
+from spoonbill.writers.xlsx import WORKBOOK_OPTIONS, XLSX_MAX_ROWS, continuation_name, init_sheet_columns, write_row
+
+LOGGER = logging.getLogger("spoonbill")
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def render_sheet(table, spool, part, headers, types, selected):
+    """Render rows spooled for single sheet into separate workbook
+
+    Runs inside worker process. Sheets other than the first one are rendered after empty
+    placeholder sheet, so they are not marked as selected in the final workbook.
+
+    :param table: Table name
+    :param spool: Path to file with pickled batches of rows
+    :param part: Path of workbook to create
+    :param headers: Mapping between column and its header
+    :param types: Mapping between column and its json type
+    :param selected: Sheet is the first one in the final workbook
+    :return: Name of worksheet xml inside created workbook
+    """
+    workbook = xlsxwriter.Workbook(part, WORKBOOK_OPTIONS)
+    if not selected:
+        workbook.add_worksheet()
+    sheet = workbook.add_worksheet()
+    columns = init_sheet_columns(sheet, table, headers, types)
+    row_index = 1
+    with open(spool, "rb") as fd:
+        while True:
+            try:
+                rows = pickle.load(fd)
+            except EOFError:
+                break
+            for row in rows:
+                write_row(columns, row_index, row, table)
+                row_index += 1
+    workbook.close()
+    return f"xl/worksheets/sheet{1 if selected else 2}.xml"
+
+
+class ParallelXlsxWriter(BaseWriter):
+    """Writer class with output to xlsx file rendering every sheet in separate process
+
+    During flattening rows are only spooled to temporary files, on exit worksheets are rendered
+    by pool of worker processes and assembled into single workbook with the same content as
+    produced by `XlsxWriter`. Cells are written as inline strings, so sheets do not share state.
+
+    :param workdir: Working directory
+    :param tables: Tables data
+    :options: Flattening options
+    :param max_rows: Maximum number of rows in single sheet including headers
+    :param workers: Number of worker processes, defaults to number of CPUs
+    :param tmpdir: Directory for temporary files
+    """
+
+    name = "xlsx"
+
+    def __init__(
+        self, workdir, tables, options, filename="result.xlsx", max_rows=XLSX_MAX_ROWS, workers=None, tmpdir=None
+    ):
+        super().__init__(workdir, tables, options)
+        self.path = Path(workdir / filename)
+        self.paths = [self.path]
+        self.max_rows = max_rows
+        self.workers = workers
+        self.tmpdir = tmpdir
+        self.continuations = defaultdict(list)
+        self.row_counters = {}
+        # (table, sheet name, spool path) in order of sheets in workbook
+        self.sheets = []
+        self._spools = {}
+        self._workdir = None
+
+    def _add_sheet(self, name, sheet_name):
+        spool = self._workdir / f"{len(self.sheets)}.pickle"
+        if name in self._spools:
+            self._spools[name].close()
+        self._spools[name] = open(spool, "wb")
+        self.sheets.append((name, sheet_name, spool))
+        self.row_counters[name] = 1
+
+    def _next_sheet(self, name):
+        sheet_name = continuation_name(self.names[name], {sheet for _table, sheet, _spool in self.sheets})
+        LOGGER.info(_("Table {} exceeded sheet size, continuing in sheet {}").format(name, sheet_name))
+        self.continuations[name].append(sheet_name)
+        self._add_sheet(name, sheet_name)
+
+    def __enter__(self):
+        """Prepare temporary files for every sheet"""
+        self._workdir = Path(tempfile.mkdtemp(prefix="spoonbill-xlsx-", dir=self.tmpdir))
+        for name, table in self.tables.items():
+            table_name, _headers = self.init_sheet(name, table)
+            self._add_sheet(name, table_name)
+        return self
+
+    def __exit__(self, exc_type, *args):
+        try:
+            for spool in self._spools.values():
+                spool.close()
+            if exc_type is None:
+                self._render()
+        finally:
+            shutil.rmtree(self._workdir, ignore_errors=True)
+
+    def _render(self):
+        LOGGER.info(_("Dumping all sheets to file to file '{}'").format(self.path))
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = [
+                pool.submit(
+                    render_sheet,
+                    name,
+                    spool,
+                    spool.with_suffix(".xlsx"),
+                    self.headers[name],
+                    self.types[name],
+                    index == 0,
+                )
+                for index, (name, _sheet, spool) in enumerate(self.sheets)
+            ]
+            members = [future.result() for future in futures]
+
+        skeleton = self._workdir / "skeleton.xlsx"
+        workbook = xlsxwriter.Workbook(skeleton, WORKBOOK_OPTIONS)
+        for _name, sheet_name, _spool in self.sheets:
+            workbook.add_worksheet(sheet_name)
+        workbook.close()
+
+        parts = {
+            f"xl/worksheets/sheet{index}.xml": (spool.with_suffix(".xlsx"), member)
+            for index, ((_name, _sheet, spool), member) in enumerate(zip(self.sheets, members), 1)
+        }
+        with zipfile.ZipFile(skeleton) as src, zipfile.ZipFile(self.path, "w", zipfile.ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                if info.filename not in parts:
+                    dst.writestr(info, src.read(info))
+                    continue
+                part, member = parts[info.filename]
+                with zipfile.ZipFile(part) as part_zip:
+                    size = part_zip.getinfo(member).file_size
+                    with part_zip.open(member) as reader, dst.open(
+                        info.filename, "w", force_zip64=size > zipfile.ZIP64_LIMIT
+                    ) as writer:
+                        shutil.copyfileobj(reader, writer, COPY_BUFFER_SIZE)
+
+    def writerow(self, table, row):
+        """Spool row to be written"""
+        self.writerows(table, [row])
+
+    def writerows(self, table, rows):
+        """Spool rows to be written"""
+        valid = self.valid_rows(table, rows)
+        if table not in self._spools:
+            return
+
+        while valid:
+            free = self.max_rows - self.row_counters[table]
+            if free <= 0:
+                self._next_sheet(table)
+                continue
+            chunk, valid = valid[:free], valid[free:]
+            pickle.dump(chunk, self._spools[table], pickle.HIGHEST_PROTOCOL)
+            self.row_counters[table] += len(chunk)
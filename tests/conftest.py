@@ -1,8 +1,12 @@
 import json
 import pathlib
 import pickle
+import re
+import threading
 from collections import OrderedDict
 from decimal import Decimal
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 
 import pytest
 
@@ -18,6 +22,44 @@ releases_path = here / "data" / "ocds-sample-data.json"
 analyzed_path = here / "data" / "analyzed"
 
 
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """Serve test data supporting single byte range requests, if enabled on server"""
+
+    def log_message(self, *args):
+        pass
+
+    def end_headers(self):
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def do_GET(self):
+        match = re.match(r"bytes=(\d+)-(\d+)$", self.headers.get("Range", ""))
+        if not (self.server.ranges and match):
+            return super().do_GET()
+        data = pathlib.Path(self.translate_path(self.path)).read_bytes()
+        start, end = int(match.group(1)), int(match.group(2)) + 1
+        content = data[start:end]
+        self.send_response(206)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+        self.end_headers()
+        self.wfile.write(content)
+
+
+@pytest.fixture(params=[True, False], ids=["ranges", "stream"])
+def data_server(request):
+    """Base url of server with test data, parametrized with and without byte ranges support"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(RangeRequestHandler, directory=str(here / "data")))
+    server.ranges = request.param
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
 @pytest.fixture
 def schema():
     with open(schema_path) as fd:
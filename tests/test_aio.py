@@ -0,0 +1,138 @@
+import asyncio
+import threading
+
+import pytest
+
+from spoonbill import FileAnalyzer, FileFlattener
+from spoonbill.aio import AsyncFileAnalyzer, AsyncFileFlattener, aclosing
+from spoonbill.flatten import FlattenOptions
+from spoonbill.stream import StreamFlattener
+
+from .conftest import releases_path
+from .data import TEST_ROOT_TABLES
+from .utils import read_csv_rows
+
+OPTIONS = {"selection": {"tenders": {"split": True}, "parties": {"split": False}}}
+
+
+async def upload(chunk_size=100):
+    data = releases_path.read_bytes()
+    for start in range(0, len(data), chunk_size):
+        end = start + chunk_size
+        await asyncio.sleep(0)
+        yield data[start:end]
+
+
+def test_async_analyzer(schema, tmpdir):
+    expected = FileAnalyzer(tmpdir, schema=schema, root_tables=TEST_ROOT_TABLES)
+    for _ in expected.analyze_file(releases_path):
+        pass
+
+    async def analyze(source):
+        analyzer = FileAnalyzer(tmpdir, schema=schema, root_tables=TEST_ROOT_TABLES)
+        progress = [item async for item in AsyncFileAnalyzer(analyzer, chunk_size=512).analyze_file(source)]
+        return analyzer, progress
+
+    for source in (releases_path, upload()):
+        analyzer, progress = asyncio.run(analyze(source))
+        assert progress[-1] == (releases_path.stat().st_size, 6)
+        assert analyzer.spec.tables == expected.spec.tables
+
+
+def test_async_flattener(spec_analyzed, tmpdir):
+    options = FlattenOptions(**OPTIONS)
+    expected = FileFlattener(tmpdir, options, spec_analyzed.tables, csv=True, xlsx=None, in_memory=True)
+    for _ in expected.flatten_file(releases_path):
+        pass
+
+    async def flatten(source):
+        flattener = FileFlattener(tmpdir, options, spec_analyzed.tables, csv=True, xlsx=None, in_memory=True)
+        batches = [batch async for batch in AsyncFileFlattener(flattener).flatten_file(source)]
+        return flattener, batches
+
+    async def flatten_all():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(ticker())
+        results = await asyncio.gather(flatten(releases_path), flatten(upload()), flatten(upload(7)))
+        task.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(flatten_all())
+    assert ticks > len(results)
+    for flattener, batches in results:
+        assert batches[-1][0] == 6
+        assert sum(len(rows.get("tenders", [])) for _count, rows in batches) == 4
+        for name, result in expected.results.items():
+            assert flattener.results[name].getvalue() == result.getvalue()
+
+
+def test_async_flattener_cancel(spec_analyzed, tmpdir):
+    options = FlattenOptions(**OPTIONS)
+    flattener = FileFlattener(tmpdir, options, spec_analyzed.tables, csv=tmpdir, xlsx=None)
+    batches = []
+
+    async def flatten():
+        async with aclosing(AsyncFileFlattener(flattener).flatten_file(upload(1))) as iterator:
+            async for batch in iterator:
+                batches.append(batch)
+                await asyncio.sleep(3600)
+
+    async def cancel():
+        task = asyncio.create_task(flatten())
+        while not batches:
+            await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    assert len(batches) == 1
+    # writers are closed with rows flattened before cancellation
+    rows = read_csv_rows(tmpdir / "tenders.csv")
+    assert len(rows) == len(batches[0][1].get("tenders", []))
+
+
+def test_async_flattener_cancel_processing(spec_analyzed, tmpdir, monkeypatch):
+    options = FlattenOptions(**OPTIONS)
+    flattener = FileFlattener(tmpdir, options, spec_analyzed.tables, csv=tmpdir, xlsx=None)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    original_feed, original_exit = StreamFlattener.feed, StreamFlattener.__exit__
+
+    def slow_feed(self, chunk):
+        started.set()
+        release.wait()
+        calls.append("feed")
+        return original_feed(self, chunk)
+
+    def tracked_exit(self, *args):
+        calls.append("exit")
+        return original_exit(self, *args)
+
+    monkeypatch.setattr(StreamFlattener, "feed", slow_feed)
+    monkeypatch.setattr(StreamFlattener, "__exit__", tracked_exit)
+
+    async def flatten():
+        async with aclosing(AsyncFileFlattener(flattener).flatten_file(upload())) as iterator:
+            async for _batch in iterator:
+                pass
+
+    async def cancel():
+        task = asyncio.create_task(flatten())
+        while not started.is_set():
+            await asyncio.sleep(0)
+        task.cancel()
+        asyncio.get_running_loop().call_later(0.05, release.set)
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    # chunk being processed when cancelled is finished before writers are closed
+    assert calls == ["feed", "exit"]
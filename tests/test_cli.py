@@ -1,13 +1,20 @@
+import csv
+import gzip
+import json
 import logging
 import os
 import pathlib
 import shutil
+import sqlite3
 
+import pytest
 from click.testing import CliRunner
 
 from spoonbill.cli import cli
 from spoonbill.utils import RepeatFilter
 
+from .utils import read_csv_rows, write_record_package
+
 LOGGER = logging.getLogger("spoonbill")
 LOGGER.addFilter(RepeatFilter())
 
@@ -232,3 +239,271 @@ def test_empty_list_file():
         shutil.copyfile(EMPTY_LIST_FILE, "data.json")
         result = runner.invoke(cli, ["data.json"])
         assert result.exit_code == 0
+
+
+def test_release_filters():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        os.mkdir("test")
+        result = runner.invoke(
+            cli,
+            [
+                "--schema",
+                "schema.json",
+                "--csv",
+                "test",
+                "--date-from",
+                "2010-03",
+                "--date-to",
+                "2010-03",
+                "--tag",
+                "tenderAmendment",
+                "data.json",
+            ],
+        )
+        assert result.exit_code == 0
+        assert "Flattening only releases matching provided filters" in result.output
+        assert "Done flattening. Flattened objects: 1" in result.output
+
+
+def test_latest():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--latest", "data.json"])
+        assert result.exit_code == 0
+        assert "Flattening only the most recent release for every ocid" in result.output
+        assert "Done flattening. Flattened objects: 1" in result.output
+
+
+def test_record_package(releases):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        write_record_package("records.json", releases)
+        shutil.copyfile(SCHEMA, "schema.json")
+        result = runner.invoke(cli, ["--schema", "schema.json", "records.json"])
+        assert result.exit_code == 0
+        assert "Input file is record package" in result.output
+        assert "Using compiled releases of records" in result.output
+        assert "Done flattening. Flattened objects: 1" in result.output
+
+
+def test_record_package_without_compiled_release(releases):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("records.json", "w") as fd:
+            json.dump({"uri": "test", "records": [{"ocid": releases[0]["ocid"], "releases": releases[:2]}]}, fd)
+        shutil.copyfile(SCHEMA, "schema.json")
+        result = runner.invoke(cli, ["--schema", "schema.json", "records.json"])
+        assert result.exit_code == 2
+        assert "Records without compiledRelease are not supported" in result.output
+
+
+def test_background_writer():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--background-writer", "data.json"])
+        assert result.exit_code == 0
+        assert "Writer queue: max depth" in result.output
+        assert "Done flattening. Flattened objects: 6" in result.output
+
+
+def test_xlsx_workbook_rows():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--xlsx-workbook-rows", "10", "data.json"])
+        assert result.exit_code == 0
+        assert "Workbook continued in files" in result.output
+        assert pathlib.Path("result_2.xlsx").exists()
+
+
+def test_xlsx_workers():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--xlsx-workers", "2", "data.json"])
+        assert result.exit_code == 0
+        assert "Done flattening" in result.output
+        assert pathlib.Path("result.xlsx").exists()
+        result = runner.invoke(
+            cli, ["--schema", "schema.json", "--xlsx-workers", "2", "--xlsx-workbook-rows", "10", "data.json"]
+        )
+        assert result.exit_code == 2
+
+
+def test_compression():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        os.mkdir("test")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--csv", "test", "--compression", "gzip", "data.json"])
+        assert result.exit_code == 0
+        assert "Csv files compressed with gzip to *.csv.gz files" in result.output
+        with gzip.open("test/tenders.csv.gz", "rt") as fd:
+            assert fd.readline().startswith("ocid,id,rowID")
+
+
+def test_csv_max_rows():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        os.mkdir("test")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--csv", "test", "--csv-max-rows", "2", "data.json"])
+        assert result.exit_code == 0
+        assert "Csv files split into parts" in result.output
+        assert pathlib.Path("test/manifest.json").exists()
+        assert pathlib.Path("test/tenders-00001.csv").exists()
+
+
+def test_buckets():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        os.mkdir("test")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--csv", "test", "--buckets", "4", "data.json"])
+        assert result.exit_code == 0
+        assert "Files partitioned by ocid into 4 buckets" in result.output
+        assert pathlib.Path("test/manifest.json").exists()
+        assert pathlib.Path("test/bucket-0003/tenders.csv").exists()
+
+
+def test_sqlite():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--sqlite", "result.sqlite", "data.json"])
+        assert result.exit_code == 0
+        connection = sqlite3.connect("result.sqlite")
+        assert connection.execute('SELECT count(*) FROM "tenders"').fetchone()[0] > 0
+        connection.close()
+
+
+def test_postgres():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        os.mkdir("pg")
+        result = runner.invoke(
+            cli, ["--schema", "schema.json", "--postgres", "pg", "--postgres-format", "binary", "data.json"]
+        )
+        assert result.exit_code == 0
+        assert pathlib.Path("pg/tenders.bin").exists()
+        script = pathlib.Path("pg/load.sql").read_text()
+        assert "FORMAT binary" in script
+        assert 'CREATE INDEX "tenders_ocid" ON "tenders" ("ocid");' in script
+
+
+def test_parquet():
+    pytest.importorskip("pyarrow")
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        os.mkdir("parquet")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--parquet", "parquet", "data.json"])
+        assert result.exit_code == 0
+        assert pathlib.Path("parquet/tenders.parquet").exists()
+
+
+def test_surrogate_keys():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        os.mkdir("test")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--drop-string-ids", "data.json"])
+        assert result.exit_code != 0
+        assert "requires --surrogate-keys" in result.output
+        result = runner.invoke(
+            cli,
+            [
+                "--schema",
+                "schema.json",
+                "--surrogate-keys",
+                "hash",
+                "--drop-string-ids",
+                "--csv",
+                "test",
+                "--sqlite",
+                "r.sqlite",
+                "data.json",
+            ],
+        )
+        assert result.exit_code == 0
+        with open("test/tenders.csv") as fd:
+            headers = next(csv.reader(fd))
+        assert "rowKey" in headers
+        assert "rowID" not in headers
+        connection = sqlite3.connect("r.sqlite")
+        indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert "tenders_rowKey" in indexes
+        connection.close()
+
+
+def test_cluster():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        os.mkdir("test")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--csv", "test", "--cluster", "data.json"])
+        assert result.exit_code == 0
+        with open("test/tenders.index.jsonl") as fd:
+            entry = json.loads(fd.readline())
+        assert entry["file"] == "tenders.csv"
+        assert entry["rows"] > 0
+
+
+def test_column_stats():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        os.mkdir("test")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--csv", "test", "--column-stats", "data.json"])
+        assert result.exit_code == 0
+        assert "Column statistics written to" in result.output
+        with open("test/stats.json") as fd:
+            stats = json.load(fd)
+        assert stats["tables"]["tenders"]["rows"] > 0
+
+
+def test_url(data_server):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        os.mkdir("local")
+        os.mkdir("remote")
+        result = runner.invoke(cli, ["--schema", "schema.json", "--csv", "local", "data.json"])
+        assert result.exit_code == 0
+        url = f"{data_server}/ocds-sample-data.json"
+        result = runner.invoke(cli, ["--schema", "schema.json", "--csv", "remote", url])
+        assert result.exit_code == 0
+        assert os.path.exists("ocds-sample-data.json.state")
+        for name in ("tenders.csv", "parties.csv"):
+            assert read_csv_rows(f"remote/{name}") == read_csv_rows(f"local/{name}")
+
+
+def test_dedup_capacity():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        shutil.copyfile(FILENAME, "data.json")
+        shutil.copyfile(SCHEMA, "schema.json")
+        args = ["--schema", "schema.json", "--dedup", "id", "--dedup-mode", "bloom", "--dedup-capacity", "2"]
+        result = runner.invoke(cli, [*args, "data.json"])
+        assert result.exit_code == 0
+        assert "Skipped 0 duplicate releases" in result.output
@@ -0,0 +1,142 @@
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from spoonbill import FileAnalyzer, FileFlattener
+from spoonbill.filters import ReleaseDeduplicator, ReleaseFilter, filter_releases
+from spoonbill.flatten import FlattenOptions
+
+from .conftest import releases_path
+from .data import TEST_ROOT_TABLES
+from .utils import read_csv_rows
+
+
+def test_filter_by_date(releases):
+    predicate = ReleaseFilter(date_from="2010-03", date_to="2010-03")
+    ids = [r["id"] for r in filter_releases(releases, predicate)]
+    assert ids == ["ocds-213czf-000-00001-02-tender", "ocds-213czf-000-00001-03-tenderAmendment"]
+
+
+def test_filter_by_tag_and_buyer(releases):
+    predicate = ReleaseFilter(tags=["award", "contract"], buyers=["GB-LAC-E09000003"])
+    assert len(list(filter_releases(releases, predicate))) == 2
+    predicate = ReleaseFilter(tags=["award"], buyers=["missing"])
+    assert not list(filter_releases(releases, predicate))
+
+
+def test_filter_by_ocid(releases):
+    releases[0]["ocid"] = "ocds-0"
+    releases[-1]["ocid"] = "ocds-9"
+    predicate = ReleaseFilter(ocids=["ocds-0"])
+    assert [r["ocid"] for r in filter_releases(releases, predicate)] == ["ocds-0"]
+    assert not ReleaseFilter()
+
+
+def test_filter_sorted_input_stops_early(releases):
+    predicate = ReleaseFilter(date_to="2010-03-15", sorted_by="date")
+    seen = []
+
+    def tracked():
+        for release in releases:
+            seen.append(release["id"])
+            yield release
+
+    kept = list(filter_releases(tracked(), predicate))
+    assert len(kept) == 2
+    assert len(seen) == 3
+
+
+def test_file_flattener_filter(spec_analyzed, tmpdir):
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}}})
+    workdir = Path(tmpdir)
+    flattener = FileFlattener(
+        workdir,
+        options,
+        spec_analyzed.tables,
+        csv=workdir,
+        xlsx=None,
+        release_filter=ReleaseFilter(tags=["tender"]),
+    )
+    counts = list(flattener.flatten_file(releases_path))
+    assert counts == [0]
+    rows = read_csv_rows(workdir / "tenders.csv")
+    assert [row["id"] for row in rows] == ["ocds-213czf-000-00001-02-tender"]
+
+
+@pytest.mark.parametrize("mode", ["exact", "bloom"])
+def test_dedup(releases, mode):
+    dedup = ReleaseDeduplicator(mode=mode)
+    kept = list(filter_releases(releases + releases[:2], dedup))
+    assert len(kept) == len(releases)
+    assert dedup.total == len(releases) + 2
+    assert dedup.duplicates == 2
+
+
+@patch("spoonbill.LOGGER.warning")
+def test_dedup_bloom_capacity(log, releases):
+    dedup = ReleaseDeduplicator(mode="bloom", capacity=2)
+    list(filter_releases(releases, dedup))
+    assert log.call_count == 1
+    assert "More than 2 releases seen" in log.call_args[0][0]
+
+
+def test_dedup_by_hash(releases):
+    changed = dict(releases[0], date="2020-01-01T00:00:00Z")
+    dedup = ReleaseDeduplicator(key="hash")
+    kept = list(filter_releases([releases[0], releases[0], changed], dedup))
+    assert len(kept) == 2
+    assert dedup.duplicates == 1
+
+
+def test_dedup_spill(releases):
+    dedup = ReleaseDeduplicator(max_keys=2)
+    kept = list(filter_releases(releases + releases, dedup))
+    assert len(kept) == len(releases)
+    assert dedup.duplicates == len(releases)
+    dedup.close()
+
+
+def test_dedup_analyze_and_flatten(schema, tmpdir, releases):
+    workdir = Path(tmpdir)
+    with open(releases_path) as fd:
+        package = json.load(fd)
+    package["releases"] = package["releases"] * 2
+    with open(workdir / "data.json", "w") as fd:
+        json.dump(package, fd)
+
+    analyzer = FileAnalyzer(workdir, schema=schema, root_tables=TEST_ROOT_TABLES, dedup=ReleaseDeduplicator())
+    for _ in analyzer.analyze_file("data.json"):
+        pass
+    assert analyzer.dedup.duplicates == len(releases)
+    assert analyzer.spec.tables["tenders"].total_rows == 4
+
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}}})
+    flattener = FileFlattener(
+        workdir, options, analyzer.spec.tables, csv=workdir, xlsx=None, dedup=ReleaseDeduplicator()
+    )
+    for _ in flattener.flatten_file("data.json"):
+        pass
+    assert flattener.dedup.duplicates == len(releases)
+    assert len(read_csv_rows(workdir / "tenders.csv")) == 4
+
+
+def test_file_flattener_latest(spec_analyzed, tmpdir):
+    workdir = Path(tmpdir)
+    with open(releases_path) as fd:
+        package = json.load(fd)
+    other = dict(package["releases"][1], ocid="ocds-213czf-000-00002")
+    package["releases"].insert(0, other)
+    with open(workdir / "data.json", "w") as fd:
+        json.dump(package, fd)
+
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}}})
+    flattener = FileFlattener(workdir, options, spec_analyzed.tables, csv=workdir, xlsx=None, latest=True)
+    counts = list(flattener.flatten_file("data.json"))
+    assert counts == [0, 1]
+    rows = read_csv_rows(workdir / "tenders.csv")
+    # latest release of the second ocid has no tender
+    assert [(row["ocid"], row["id"]) for row in rows] == [
+        ("ocds-213czf-000-00002", "ocds-213czf-000-00001-02-tender"),
+    ]
@@ -1,4 +1,5 @@
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 from jmespath import search
@@ -284,3 +285,107 @@ def test_flatten_fields_compare(spec_analyzed, releases):
                             expected = JOINABLE_SEPARATOR.join(expected)
                         assert expected == value
                 counters[name] += 1
+
+
+def _snapshot(tables):
+    return {
+        name: (
+            [(c.id, c.hits) for c in table.columns.values()],
+            [(c.id, c.hits) for c in table.combined_columns.values()],
+            dict(table.titles),
+        )
+        for name, table in tables.items()
+    }
+
+
+def _flatten_all(flattener, releases):
+    all_rows = defaultdict(list)
+    for _count, flat in flattener.flatten(releases):
+        for name, rows in flat.items():
+            all_rows[name].extend(rows)
+    return all_rows
+
+
+def test_flattener_does_not_modify_tables(spec, releases):
+    releases[0]["tender"]["items"] = releases[0]["tender"]["items"] * 6
+    for _ in spec.process_items(releases):
+        pass
+    before = _snapshot(spec.tables)
+    selection = {"tenders": {"split": True, "repeat": ["/tender/id"], "unnest": ["/tender/items/0/id"]}}
+    options = FlattenOptions(**{"selection": selection, "count": True})
+    flattener = Flattener(options, spec.tables)
+    assert "tenders_items" in flattener.tables
+    assert "/tender/itemsCount" in flattener.tables["tenders"]
+    assert list(options.selection) == ["tenders"]
+    assert _snapshot(spec.tables) == before
+    assert "/tender/itemsCount" not in spec.tables["tenders"]
+
+
+def test_flattener_concurrent(spec_analyzed, releases):
+    configs = [
+        FlattenOptions(**{"selection": {"tenders": {"split": True}, "parties": {"split": False}}, "count": True}),
+        FlattenOptions(**{"selection": {"tenders": {"split": False, "only": ["/tender/id"]}}}),
+        FlattenOptions(**{"selection": {"tenders": {"split": True, "repeat": ["/tender/id"]}}}),
+    ]
+    expected = [_flatten_all(Flattener(options, spec_analyzed.tables), releases) for options in configs]
+    flatteners = [Flattener(options, spec_analyzed.tables) for options in configs] * 4
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(lambda f: _flatten_all(f, releases), flatteners))
+    for index, result in enumerate(results):
+        assert result == expected[index % len(configs)]
+
+
+@pytest.mark.parametrize("mode", ["hash", "sequence"])
+def test_flatten_surrogate_keys(spec, releases, mode):
+    releases[0]["tender"]["items"] = releases[0]["tender"]["items"] * 6
+    for _ in spec.process_items(releases):
+        pass
+    selection = {"tenders": {"split": True}, "parties": {"split": False}}
+    options = FlattenOptions(**{"selection": selection, "surrogate_keys": mode})
+    flattener = Flattener(options, spec.tables)
+    tenders = flattener.tables["tenders"].available_rows()
+    assert tenders.index("rowKey") == tenders.index("rowID") - 1
+    assert "parentKey" not in tenders
+    assert "parentKey" in flattener.tables["tenders_items"].available_rows()
+
+    all_rows = _flatten_all(flattener, releases)
+    keys = {}
+    for name, rows in all_rows.items():
+        for row in rows:
+            assert isinstance(row["rowKey"], int)
+            assert -(2**63) <= row["rowKey"] < 2**63
+            keys[row["rowKey"]] = row
+    assert len(keys) == sum(len(rows) for rows in all_rows.values())
+    for row in all_rows["tenders_items"]:
+        parent = keys[row["parentKey"]]
+        assert parent["ocid"] == row["ocid"]
+        assert parent["/tender/id"] == row["parentID"]
+
+    again = _flatten_all(Flattener(options, spec.tables), releases)
+    assert again == all_rows
+    # flattener keeps no state between calls, sequences start from 1 again
+    assert _flatten_all(flattener, releases) == all_rows
+
+
+def test_flatten_drop_string_ids(spec_analyzed, releases):
+    options = FlattenOptions(
+        **{"selection": {"tenders": {"split": True}}, "surrogate_keys": "hash", "drop_string_ids": True}
+    )
+    flattener = Flattener(options, spec_analyzed.tables)
+    for table in flattener.tables.values():
+        assert "rowID" not in table.available_rows()
+        assert "parentID" not in table.available_rows()
+    for _count, flat in flattener.flatten(releases):
+        for rows in flat.values():
+            for row in rows:
+                assert "rowKey" in row
+                assert "rowID" not in row
+                assert "parentID" not in row
+    assert "rowID" in spec_analyzed.tables["tenders"].available_rows()
+
+
+def test_flatten_surrogate_keys_options():
+    with pytest.raises(ValueError):
+        FlattenOptions(selection={}, surrogate_keys="uuid")
+    with pytest.raises(ValueError):
+        FlattenOptions(selection={}, drop_string_ids=True)
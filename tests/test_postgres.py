@@ -0,0 +1,149 @@
+import os
+import struct
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+from spoonbill.flatten import Flattener, FlattenOptions
+from spoonbill.writers.postgres import BINARY_HEADER, PostgresCopyWriter, encode_numeric
+
+from .utils import prepare_tables
+
+TEXT_UNESCAPES = {"\\\\": "\\", "\\t": "\t", "\\n": "\n", "\\r": "\r"}
+
+
+def read_text_copy(path):
+    rows = []
+    with open(path, encoding="utf-8") as fd:
+        for line in fd:
+            fields = []
+            for field in line.rstrip("\n").split("\t"):
+                if field == "\\N":
+                    fields.append(None)
+                    continue
+                for escaped, char in TEXT_UNESCAPES.items():
+                    field = field.replace(escaped, char)
+                fields.append(field)
+            rows.append(fields)
+    return rows
+
+
+def decode_numeric(data):
+    ndigits, weight, sign, dscale = struct.unpack(">hhHH", data[:8])
+    digits = struct.unpack(f">{ndigits}H", data[8:])
+    value = sum(Decimal(digit) * Decimal(10000) ** (weight - i) for i, digit in enumerate(digits))
+    return -value if sign else value
+
+
+def read_binary_copy(path):
+    with open(path, "rb") as fd:
+        data = fd.read()
+    assert data.startswith(BINARY_HEADER)
+    offset = len(BINARY_HEADER)
+    rows = []
+    while True:
+        (count,) = struct.unpack_from(">h", data, offset)
+        offset += 2
+        if count == -1:
+            break
+        fields = []
+        for _ in range(count):
+            (length,) = struct.unpack_from(">i", data, offset)
+            offset += 4
+            if length == -1:
+                fields.append(None)
+                continue
+            end = offset + length
+            fields.append(data[offset:end])
+            offset = end
+        rows.append(fields)
+    assert offset == len(data)
+    return rows
+
+
+@pytest.mark.parametrize(
+    "value", [Decimal("10.5"), Decimal("-0.0001"), Decimal("123456789.123"), Decimal("1E+5"), 0, 42, 2.25]
+)
+def test_encode_numeric(value):
+    assert decode_numeric(encode_numeric(value)) == Decimal(str(value))
+
+
+def write_tenders(spec, workdir, format):
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}}})
+    tables = prepare_tables(spec, options)
+    tenders = tables["tenders"]
+    for col in ("/tender/id", "/tender/value/amount", "/tender/numberOfTenderers", "/tender/hasEnquiries"):
+        tenders.inc_column(col, col)
+    tenders.columns["/tender/hasEnquiries"].type = "boolean"
+    with PostgresCopyWriter(workdir, tables, options, format=format) as writer:
+        writer.writerows(
+            "tenders",
+            [
+                {
+                    "/tender/id": "a\tb\\c",
+                    "/tender/value/amount": Decimal("10.5"),
+                    "/tender/numberOfTenderers": 2,
+                    "/tender/hasEnquiries": True,
+                },
+                {"/tender/id": "2", "/tender/numberOfTenderers": "n/a"},
+            ],
+        )
+    return writer
+
+
+def test_text_copy(spec, tmpdir):
+    workdir = Path(tmpdir)
+    writer = write_tenders(spec, workdir, "text")
+    columns = list(writer.columns["tenders"])
+    rows = [dict(zip(columns, row)) for row in read_text_copy(workdir / "tenders.copy")]
+    assert rows[0]["/tender/id"] == "a\tb\\c"
+    assert rows[0]["/tender/value/amount"] == "10.5"
+    assert rows[0]["/tender/numberOfTenderers"] == "2"
+    assert rows[0]["/tender/hasEnquiries"] == "t"
+    # values not matching column type are written as NULL
+    assert rows[1]["/tender/numberOfTenderers"] is None
+    assert rows[1]["/tender/value/amount"] is None
+
+    script = (workdir / "load.sql").read_text()
+    assert '"/tender/value/amount" numeric' in script
+    assert '"/tender/numberOfTenderers" bigint' in script
+    assert "\\copy \"tenders\" FROM 'tenders.copy' WITH (FORMAT text)" in script
+
+
+def test_binary_copy(spec, tmpdir):
+    workdir = Path(tmpdir)
+    writer = write_tenders(spec, workdir, "binary")
+    columns = list(writer.columns["tenders"])
+    rows = [dict(zip(columns, row)) for row in read_binary_copy(workdir / "tenders.bin")]
+    assert rows[0]["/tender/id"] == "a\tb\\c".encode()
+    assert decode_numeric(rows[0]["/tender/value/amount"]) == Decimal("10.5")
+    assert struct.unpack(">q", rows[0]["/tender/numberOfTenderers"]) == (2,)
+    assert rows[0]["/tender/hasEnquiries"] == b"\x01"
+    assert rows[1]["/tender/numberOfTenderers"] is None
+
+
+@pytest.mark.skipif(not os.getenv("SPOONBILL_TEST_POSTGRES"), reason="SPOONBILL_TEST_POSTGRES dsn is not set")
+@pytest.mark.parametrize("format", ["text", "binary"])
+def test_load_postgres(spec_analyzed, releases, flatten_options, tmpdir, format):
+    psycopg2 = pytest.importorskip("psycopg2")
+    flattener = Flattener(flatten_options, spec_analyzed.tables)
+    workdir = Path(tmpdir)
+    with PostgresCopyWriter(workdir, flattener.tables, flattener.options, format=format) as writer:
+        for _count, flat in flattener.flatten(releases):
+            for name, rows in flat.items():
+                writer.writerows(name, rows)
+    connection = psycopg2.connect(os.environ["SPOONBILL_TEST_POSTGRES"])
+    try:
+        with connection.cursor() as cursor:
+            for name in writer.fds:
+                cursor.execute(writer.create_table_sql(name).replace("CREATE TABLE", "CREATE TEMPORARY TABLE"))
+                with open(writer.files[name], "rb") as fd:
+                    cursor.copy_expert(f'COPY "{writer.names[name]}" FROM STDIN WITH (FORMAT {format})', fd)
+            cursor.execute('SELECT count(*) FROM "tenders"')
+            assert cursor.fetchone()[0] == sum(
+                len(flat.get("tenders", [])) for _c, flat in flattener.flatten(releases)
+            )
+    finally:
+        connection.rollback()
+        connection.close()
@@ -0,0 +1,89 @@
+import io
+import json
+
+import pytest
+
+from spoonbill import FileAnalyzer, FileFlattener
+from spoonbill.flatten import FlattenOptions
+from spoonbill.remote import RangeReader, open_input
+from spoonbill.utils import resolve_file_uri
+
+from .conftest import releases_path, schema_path
+from .data import TEST_ROOT_TABLES
+
+OPTIONS = {"selection": {"tenders": {"split": True}, "parties": {"split": False}}}
+
+
+def test_open_input(data_server):
+    with open_input(f"{data_server}/ocds-sample-data.json", block_size=1000, workers=3) as fd:
+        assert fd.read() == releases_path.read_bytes()
+
+
+@pytest.mark.parametrize("data_server", [True], indirect=True)
+def test_range_reader(data_server):
+    data = releases_path.read_bytes()
+    reader = RangeReader(f"{data_server}/ocds-sample-data.json", len(data), block_size=1000, workers=3)
+    with io.BufferedReader(reader, buffer_size=100) as fd:
+        assert fd.read() == data
+        assert reader.requests == -(-len(data) // 1000)
+        fd.seek(-10, io.SEEK_END)
+        assert fd.read() == data[-10:]
+        fd.seek(0)
+        assert fd.read(50) == data[:50]
+
+
+@pytest.mark.parametrize("data_server", [False], indirect=True)
+def test_range_reader_unsupported(data_server):
+    size = releases_path.stat().st_size
+    with RangeReader(f"{data_server}/ocds-sample-data.json", size, block_size=1000) as reader:
+        with pytest.raises(IOError):
+            reader.read(10)
+
+
+def test_analyze_flatten_url(data_server, schema, spec_analyzed, tmpdir):
+    url = f"{data_server}/ocds-sample-data.json"
+    expected = FileAnalyzer(tmpdir, schema=schema, root_tables=TEST_ROOT_TABLES)
+    for _ in expected.analyze_file(releases_path):
+        pass
+    analyzer = FileAnalyzer(tmpdir, schema=schema, root_tables=TEST_ROOT_TABLES)
+    progress = list(analyzer.analyze_file(url))
+    assert progress[-1][1] == 5
+    assert analyzer.spec.tables == expected.spec.tables
+
+    options = FlattenOptions(**OPTIONS)
+    expected = FileFlattener(tmpdir, options, spec_analyzed.tables, csv=True, xlsx=None, in_memory=True)
+    for _ in expected.flatten_file(releases_path):
+        pass
+    flattener = FileFlattener(tmpdir, options, spec_analyzed.tables, csv=True, xlsx=None, in_memory=True)
+    for _ in flattener.flatten_file(url):
+        pass
+    for name, result in expected.results.items():
+        assert flattener.results[name].getvalue() == result.getvalue()
+
+
+def test_flatten_url_latest(data_server, spec_analyzed, tmpdir):
+    url = f"{data_server}/ocds-sample-data.json"
+    options = FlattenOptions(**OPTIONS)
+    expected = FileFlattener(tmpdir, options, spec_analyzed.tables, xlsx=None, latest=True, in_memory=True)
+    for _ in expected.flatten_file(releases_path):
+        pass
+    flattener = FileFlattener(tmpdir, options, spec_analyzed.tables, xlsx=None, latest=True, in_memory=True)
+    with open_input(url) as fd:
+        seekable = fd.seekable()
+    if not seekable:
+        # streamed body can't be read twice
+        with pytest.raises(ValueError):
+            for _ in flattener.flatten_file(url):
+                pass
+        return
+    for _ in flattener.flatten_file(url):
+        pass
+    for name, result in expected.results.items():
+        assert flattener.results[name].getvalue() == result.getvalue()
+
+
+def test_resolve_file_uri(data_server):
+    with open(schema_path) as fd:
+        expected = json.load(fd)
+    assert resolve_file_uri(f"{data_server}/ocds-simplified-schema.json") == expected
+    assert resolve_file_uri(schema_path) == expected
@@ -137,6 +137,11 @@ def test_analyze(spec, releases):
     assert parties["/parties/roles"].hits == len(search("[].parties[].roles", releases))
 
 
+def test_analyze_empty(spec):
+    assert list(spec.process_items([])) == []
+    assert spec.total_items == -1
+
+
 @patch("spoonbill.LOGGER.error")
 def test_mismatched_types(log, spec, releases):
     releases[0]["tender"]["id"] = ["/test/id"]
@@ -0,0 +1,81 @@
+import ijson
+import pytest
+
+from spoonbill import FileAnalyzer, FileFlattener
+from spoonbill.flatten import FlattenOptions
+from spoonbill.stream import ItemParser, StreamAnalyzer, StreamFlattener
+
+from .conftest import releases_path
+from .data import TEST_ROOT_TABLES
+
+
+def chunks(size):
+    data = releases_path.read_bytes()
+    for start in range(0, len(data), size):
+        end = start + size
+        yield data[start:end]
+
+
+@pytest.mark.parametrize("size", [1, 100, 1000000])
+def test_stream_analyzer(schema, tmpdir, size):
+    expected = FileAnalyzer(tmpdir, schema=schema, root_tables=TEST_ROOT_TABLES)
+    for _ in expected.analyze_file(releases_path):
+        pass
+    analyzer = FileAnalyzer(tmpdir, schema=schema, root_tables=TEST_ROOT_TABLES)
+    stream = StreamAnalyzer(analyzer)
+    progress = [stream.feed(chunk) for chunk in chunks(size)]
+    assert progress == sorted(progress)
+    assert stream.close() == 6
+    assert analyzer.spec.total_items == expected.spec.total_items
+    assert analyzer.spec.tables == expected.spec.tables
+
+
+@pytest.mark.parametrize("size", [1, 100, 1000000])
+def test_stream_flattener(spec_analyzed, tmpdir, size):
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}, "parties": {"split": False}}})
+    expected = FileFlattener(tmpdir, options, spec_analyzed.tables, csv=True, xlsx=None, in_memory=True)
+    for _ in expected.flatten_file(releases_path):
+        pass
+    flattener = FileFlattener(tmpdir, options, spec_analyzed.tables, csv=True, xlsx=None, in_memory=True)
+    rows = []
+    with StreamFlattener(flattener) as stream:
+        for chunk in chunks(size):
+            rows.extend(stream.feed(chunk).get("tenders", []))
+        rows.extend(stream.close().get("tenders", []))
+    assert stream.count == 6
+    assert [row["/tender/id"] for row in rows if "/tender/id" in row] == [
+        "ocds-213czf-000-00001-01-planning",
+        "ocds-213czf-000-00001-01-tender",
+        "ocds-213czf-000-00001-01-tender",
+        "ocds-213czf-000-00001-01-tender",
+    ]
+    for name, result in expected.results.items():
+        assert flattener.results[name].getvalue() == result.getvalue()
+
+
+def test_stream_flattener_latest(spec_analyzed, tmpdir):
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}}})
+    flattener = FileFlattener(tmpdir, options, spec_analyzed.tables, latest=True)
+    with pytest.raises(ValueError):
+        StreamFlattener(flattener)
+
+
+def test_item_parser_incomplete():
+    parser = ItemParser()
+    assert parser.feed(b'{"releases": [{"ocid": "a"}') == [{"ocid": "a"}]
+    with pytest.raises(ijson.IncompleteJSONError):
+        parser.close()
+
+
+def test_stream_flattener_sequence_keys(spec_analyzed, tmpdir):
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}}, "surrogate_keys": "sequence"})
+    flattener = FileFlattener(tmpdir, options, spec_analyzed.tables, csv=True, xlsx=None, in_memory=True)
+    keys = []
+    with StreamFlattener(flattener) as stream:
+        for chunk in chunks(500):
+            for rows in stream.feed(chunk).values():
+                keys.extend(row["rowKey"] for row in rows)
+        for rows in stream.close().values():
+            keys.extend(row["rowKey"] for row in rows)
+    assert len(keys) > 1
+    assert sorted(keys) == list(range(1, len(keys) + 1))
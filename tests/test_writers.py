@@ -1,16 +1,37 @@
 import csv
+import gzip
+import io
+import json
+import lzma
+import sqlite3
+from collections import defaultdict
+from copy import deepcopy
+from decimal import Decimal
 from pathlib import Path
 from unittest.mock import call, patch
 
 import openpyxl
+import pytest
 
-from spoonbill import FileFlattener
+from spoonbill import FanOutFlattener, FileAnalyzer, FileFlattener
 from spoonbill.flatten import Flattener, FlattenOptions
+from spoonbill.utils import iter_file
+from spoonbill.writers import BackgroundWriter, ColumnStatsWriter, HashPartitionedWriter, SQLiteWriter
+from spoonbill.writers.column_stats import ColumnStats
 from spoonbill.writers.csv import CSVWriter
 from spoonbill.writers.xlsx import XlsxWriter
+from spoonbill.writers.xlsx_parallel import ParallelXlsxWriter
 
 from .conftest import releases_path
-from .utils import get_writers, prepare_tables, read_csv_headers, read_xlsx_headers
+from .data import TEST_ROOT_TABLES
+from .utils import (
+    get_writers,
+    prepare_tables,
+    read_csv_headers,
+    read_csv_rows,
+    read_xlsx_headers,
+    write_record_package,
+)
 
 ID_FIELDS = {"tenders": "/tender/id", "parties": "/parties/id"}
 
@@ -408,3 +429,557 @@ def test_less_five_arrays_xlsx(spec_analyzed, releases, flatten_options, tmpdir)
     xlsx_reader = openpyxl.load_workbook(path)
     for name in test_arrays:
         assert name not in xlsx_reader
+
+
+def test_flatten_compiled_records(schema, tmpdir, releases):
+    workdir = Path(tmpdir)
+    releases[1]["ocid"] = "ocds-213czf-000-00002"
+    write_record_package(workdir / "records.json", releases[:2])
+
+    analyzer = FileAnalyzer(workdir, schema=schema, root_tables=TEST_ROOT_TABLES, root_key="records", compiled=True)
+    counts = [count for _read, count in analyzer.analyze_file("records.json")]
+    assert counts == [0, 1]
+    assert analyzer.spec.tables["tenders"].total_rows == 2
+
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}}})
+    flattener = FileFlattener(
+        workdir, options, analyzer.spec.tables, root_key="records", csv=workdir, xlsx=None, compiled=True
+    )
+    assert list(flattener.flatten_file("records.json")) == [0, 1]
+    rows = read_csv_rows(workdir / "tenders.csv")
+    assert [row["ocid"] for row in rows] == ["ocds-213czf-000-00001", "ocds-213czf-000-00002"]
+
+
+@patch("spoonbill.LOGGER.warning")
+def test_iter_file_records_without_compiled_release(log, tmpdir, releases):
+    path = Path(tmpdir) / "records.json"
+    records = [{"ocid": "a", "compiledRelease": releases[0]}, {"ocid": "b", "releases": [{"url": "b.json"}]}]
+    with open(path, "w") as fd:
+        json.dump({"records": records}, fd)
+    with open(path, "rb") as fd:
+        items = list(iter_file(fd, "records", compiled=True))
+    assert [item["id"] for item in items] == [releases[0]["id"]]
+    log.assert_called_once_with("Skipped %s records without compiledRelease", 1)
+
+
+def test_background_writer(spec_analyzed, tmpdir):
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}, "parties": {"split": False}}})
+    results = {}
+    for background in (False, True):
+        workdir = Path(tmpdir) / str(background)
+        workdir.mkdir()
+        flattener = FileFlattener(
+            workdir, options, spec_analyzed.tables, csv=workdir, xlsx=None, background=background, queue_size=1
+        )
+        for _ in flattener.flatten_file(releases_path):
+            pass
+        results[background] = {name: read_csv_rows(workdir / f"{name}.csv") for name in ("tenders", "parties")}
+    assert results[True] == results[False]
+    stats = flattener.writer_stats
+    assert stats.rows == len(results[True]["tenders"]) + len(results[True]["parties"])
+    assert stats.batches == 1
+    assert stats.bottleneck in ("writing", "flattening")
+
+
+def test_background_writer_error():
+    class FailingWriter:
+        def writerows(self, table, rows):
+            raise IOError("disk is full")
+
+    with pytest.raises(IOError):
+        with BackgroundWriter([FailingWriter()], queue_size=1, batch_size=1) as writer:
+            for _ in range(10):
+                writer.writerow("tenders", {})
+
+
+def test_csv_writerows_skips_invalid(spec, tmpdir, flatten_options):
+    tables = prepare_tables(spec, flatten_options, ID_FIELDS)
+    workdir = Path(tmpdir)
+    with CSVWriter(workdir, tables, flatten_options) as writer:
+        writer.writerows("tenders", [{"/tender/id": "1"}, {"/test/test": "test"}, {"/tender/id": "2"}])
+    rows = read_csv_rows(workdir / "tenders.csv")
+    assert [row["/tender/id"] for row in rows] == ["1", "2"]
+
+
+@patch("spoonbill.LOGGER.error")
+def test_valid_rows(log, spec, tmpdir, flatten_options):
+    tables = prepare_tables(spec, flatten_options, ID_FIELDS)
+    writer = SQLiteWriter(Path(tmpdir), tables, flatten_options)
+    with writer:
+        rows = [{"/tender/id": "1"}, {"/test/test": "test"}, {"/tender/id": "2"}]
+        assert writer.valid_rows("tenders", rows) == [rows[0], rows[2]]
+        assert writer.valid_rows("test", rows) == []
+    log.assert_has_calls(
+        [
+            call("Operation produced invalid path. This a software bug, please send issue to developers"),
+            call("Failed to write row None with error dict contains fields not in fieldnames: '/test/test'"),
+            call("Invalid table test"),
+        ]
+    )
+
+
+@pytest.mark.parametrize("batch_size", [1, 4, 100])
+def test_flatten_batches(spec_analyzed, tmpdir, batch_size):
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}, "parties": {"split": False}}})
+    workdir = Path(tmpdir)
+    flattener = FileFlattener(
+        workdir, options, spec_analyzed.tables, csv=workdir, xlsx="result.xlsx", batch_size=batch_size
+    )
+    with patch.object(CSVWriter, "writerows", autospec=True, side_effect=CSVWriter.writerows) as writerows:
+        assert list(flattener.flatten_file(releases_path)) == list(range(6))
+    # one call per table per batch, if batch has rows for that table
+    assert writerows.call_count <= 2 * -(-6 // batch_size)
+    if batch_size == 100:
+        assert writerows.call_count == 2
+    assert len(read_csv_rows(workdir / "tenders.csv")) == 4
+    assert len(read_csv_rows(workdir / "parties.csv")) == 8
+    wb = openpyxl.load_workbook(filename=workdir / "result.xlsx")
+    assert wb["parties"].max_row == 9
+
+
+def test_xlsx_typed_cells(spec, tmpdir):
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}}})
+    tables = prepare_tables(spec, options)
+    tenders = tables["tenders"]
+    for col in ("/tender/id", "/tender/value/amount", "/tender/numberOfTenderers"):
+        tenders.inc_column(col, col)
+    workdir = Path(tmpdir)
+    with XlsxWriter(workdir, tables, options) as writer:
+        assert writer.types["tenders"]["/tender/value/amount"] == "number"
+        writer.writerows(
+            "tenders",
+            [
+                {"/tender/id": "1", "/tender/value/amount": 10.5, "/tender/numberOfTenderers": 2},
+                {"/tender/id": 2, "/tender/value/amount": "n/a", "/tender/numberOfTenderers": True},
+            ],
+        )
+    sheet = openpyxl.load_workbook(filename=workdir / "result.xlsx")["tenders"]
+    values = [[cell.value for cell in row] for row in sheet.iter_rows(min_row=2)]
+    headers = [cell.value for cell in sheet[1]]
+    rows = [dict(zip(headers, row)) for row in values]
+    assert rows[0]["/tender/id"] == "1"
+    assert rows[0]["/tender/value/amount"] == 10.5
+    assert rows[0]["/tender/numberOfTenderers"] == 2
+    # values not matching column type are written anyway
+    assert rows[1]["/tender/id"] == 2
+    assert rows[1]["/tender/value/amount"] == "n/a"
+    assert rows[1]["/tender/numberOfTenderers"] == "True"
+
+
+def test_xlsx_sheet_overflow(spec, tmpdir, flatten_options):
+    tables = prepare_tables(spec, flatten_options, ID_FIELDS)
+    workdir = Path(tmpdir)
+    rows = [{"/tender/id": str(i)} for i in range(7)]
+    with XlsxWriter(workdir, tables, flatten_options, max_rows=3) as writer:
+        writer.writerows("tenders", rows[:5])
+        writer.writerow("tenders", rows[5])
+        writer.writerow("tenders", rows[6])
+    assert writer.continuations == {"tenders": ["tenders_2", "tenders_3", "tenders_4"]}
+    wb = openpyxl.load_workbook(filename=workdir / "result.xlsx")
+    assert wb.sheetnames == ["tenders", "parties", "tenders_2", "tenders_3", "tenders_4"]
+    values = []
+    for name in ("tenders", "tenders_2", "tenders_3", "tenders_4"):
+        sheet = [[cell.value for cell in row] for row in wb[name].iter_rows()]
+        assert sheet[0] == ["/tender/id"]
+        assert len(sheet) <= 3
+        values.extend(row[0] for row in sheet[1:])
+    assert values == [str(i) for i in range(7)]
+
+
+def test_xlsx_workbook_overflow(spec, tmpdir, flatten_options):
+    tables = prepare_tables(spec, flatten_options, ID_FIELDS)
+    workdir = Path(tmpdir)
+    with XlsxWriter(workdir, tables, flatten_options, max_workbook_rows=4) as writer:
+        writer.writerows("tenders", [{"/tender/id": str(i)} for i in range(6)])
+        writer.writerows("parties", [{"/parties/id": "1"}])
+    assert writer.paths == [workdir / "result.xlsx", workdir / "result_2.xlsx"]
+    first = openpyxl.load_workbook(filename=workdir / "result.xlsx")
+    second = openpyxl.load_workbook(filename=workdir / "result_2.xlsx")
+    assert first["tenders"].max_row == 5
+    assert second["tenders"].max_row == 3
+    assert second["parties"].max_row == 2
+    assert second["parties"]["A1"].value == "/parties/id"
+
+
+def read_workbook(path):
+    wb = openpyxl.load_workbook(filename=path)
+    return {name: [[cell.value for cell in row] for row in wb[name].iter_rows()] for name in wb.sheetnames}
+
+
+def test_parallel_xlsx_same_as_xlsx(spec_analyzed, releases, flatten_options, tmpdir):
+    flattener = Flattener(flatten_options, spec_analyzed.tables)
+    tables = prepare_tables(spec_analyzed, flatten_options)
+    workdir = Path(tmpdir)
+    with XlsxWriter(workdir, tables, flatten_options) as writer, ParallelXlsxWriter(
+        workdir, tables, flatten_options, filename="parallel.xlsx", workers=2
+    ) as parallel:
+        for _count, flat in flattener.flatten(releases):
+            for name, rows in flat.items():
+                writer.writerows(name, rows)
+                parallel.writerows(name, rows)
+    expected = read_workbook(workdir / "result.xlsx")
+    assert read_workbook(workdir / "parallel.xlsx") == expected
+    assert len(expected["tenders"]) > 1
+    selected = openpyxl.load_workbook(filename=workdir / "parallel.xlsx").worksheets
+    assert [sheet.sheet_view.tabSelected for sheet in selected][:2] == [True, None]
+
+
+def test_parallel_xlsx_sheet_overflow(spec, tmpdir, flatten_options):
+    tables = prepare_tables(spec, flatten_options, ID_FIELDS)
+    workdir = Path(tmpdir)
+    rows = [{"/tender/id": str(i)} for i in range(7)]
+    with ParallelXlsxWriter(workdir, tables, flatten_options, max_rows=3, workers=1) as writer:
+        writer.writerows("tenders", rows[:5] + [{"/tender/id": "x", "/x": "x"}])
+        writer.writerow("tenders", rows[5])
+        writer.writerow("tenders", rows[6])
+    assert writer.continuations == {"tenders": ["tenders_2", "tenders_3", "tenders_4"]}
+    sheets = read_workbook(workdir / "result.xlsx")
+    assert list(sheets) == ["tenders", "parties", "tenders_2", "tenders_3", "tenders_4"]
+    values = []
+    for name in ("tenders", "tenders_2", "tenders_3", "tenders_4"):
+        assert sheets[name][0] == ["/tender/id"]
+        values.extend(row[0] for row in sheets[name][1:])
+    assert values == [str(i) for i in range(7)]
+    assert sheets["parties"] == [["/parties/id"]]
+
+
+def test_csv_writer_pooled_files(spec, tmpdir, flatten_options):
+    tables = prepare_tables(spec, flatten_options, ID_FIELDS)
+    workdir = Path(tmpdir)
+    with CSVWriter(workdir, tables, flatten_options, max_open=1, buffering={"tenders": 16}) as writer:
+        assert len(writer.fds) == 1
+        for i in range(3):
+            writer.writerow("tenders", {"/tender/id": str(i)})
+            writer.writerow("parties", {"/parties/id": str(i)})
+            assert list(writer.fds) == ["parties"]
+    assert not writer.fds
+    assert [row["/tender/id"] for row in read_csv_rows(workdir / "tenders.csv")] == ["0", "1", "2"]
+    assert [row["/parties/id"] for row in read_csv_rows(workdir / "parties.csv")] == ["0", "1", "2"]
+
+
+@pytest.mark.parametrize("codec,opener", [("gzip", gzip.open), ("xz", lzma.open)])
+def test_csv_writer_compression(spec, tmpdir, flatten_options, codec, opener):
+    tables = prepare_tables(spec, flatten_options, ID_FIELDS)
+    workdir = Path(tmpdir)
+    rows = [{"/tender/id": str(i)} for i in range(100)]
+    with CSVWriter(
+        workdir, tables, flatten_options, max_open=1, buffering=64, compression=codec, compression_workers=2
+    ) as writer:
+        for row in rows:
+            writer.writerow("tenders", row)
+            writer.writerow("parties", {"/parties/id": row["/tender/id"]})
+    with opener(workdir / f"tenders.csv.{codec[:2]}", "rt") as fd:
+        assert [row["/tender/id"] for row in csv.DictReader(fd)] == [row["/tender/id"] for row in rows]
+    assert not (workdir / "tenders.csv").exists()
+
+
+def test_csv_writer_zstd(spec, tmpdir, flatten_options):
+    zstandard = pytest.importorskip("zstandard")
+    tables = prepare_tables(spec, flatten_options, ID_FIELDS)
+    workdir = Path(tmpdir)
+    with CSVWriter(workdir, tables, flatten_options, compression="zstd") as writer:
+        writer.writerow("tenders", {"/tender/id": "1"})
+    with open(workdir / "tenders.csv.zst", "rb") as fd:
+        data = zstandard.ZstdDecompressor().stream_reader(fd).read()
+    assert data.decode().splitlines() == ["/tender/id", "1"]
+
+
+@pytest.mark.parametrize("limits,part_rows", [({"max_rows": 2}, [2, 2, 1]), ({"max_bytes": 20}, [3, 2])])
+def test_csv_writer_parts(spec, tmpdir, flatten_options, limits, part_rows):
+    tables = prepare_tables(spec, flatten_options, ID_FIELDS)
+    workdir = Path(tmpdir)
+    with CSVWriter(workdir, tables, flatten_options, max_open=1, **limits) as writer:
+        writer.writerows("tenders", [{"/tender/id": f"tender-{i}"} for i in range(3)])
+        writer.writerow("parties", {"/parties/id": "1"})
+        writer.writerows("tenders", [{"/tender/id": f"tender-{i}"} for i in range(3, 5)])
+    with open(workdir / "manifest.json") as fd:
+        manifest = json.load(fd)["tables"]
+    assert [part["file"] for part in manifest["tenders"]] == [
+        f"tenders-{i:05d}.csv" for i in range(1, len(part_rows) + 1)
+    ]
+    assert [part["rows"] for part in manifest["tenders"]] == part_rows
+    assert manifest["parties"] == [{"file": "parties-00001.csv", "rows": 1, "bytes": 16}]
+    values = []
+    for part in manifest["tenders"]:
+        assert (workdir / part["file"]).stat().st_size == part["bytes"]
+        values.extend(row["/tender/id"] for row in read_csv_rows(workdir / part["file"]))
+    assert values == [f"tender-{i}" for i in range(5)]
+    assert not (workdir / "tenders.csv").exists()
+
+
+def test_hash_partitioned_writer(spec_analyzed, releases, flatten_options, tmpdir):
+    for i, release in enumerate(releases):
+        release["ocid"] = f"ocds-{i}"
+    flattener = Flattener(flatten_options, spec_analyzed.tables)
+    workdir = Path(tmpdir)
+    with HashPartitionedWriter(workdir, flattener.tables, flattener.options, 3) as writer:
+        for _count, flat in flattener.flatten(releases):
+            for name, rows in flat.items():
+                writer.writerows(name, rows)
+    with open(workdir / "manifest.json") as fd:
+        manifest = json.load(fd)
+    assert manifest["buckets"] == ["bucket-0000", "bucket-0001", "bucket-0002"]
+    buckets = {}
+    for name in ("tenders", "parties"):
+        total = 0
+        for bucket, count in zip(manifest["buckets"], manifest["tables"][name]):
+            rows = read_csv_rows(workdir / bucket / f"{name}.csv")
+            assert len(rows) == count
+            total += count
+            for row in rows:
+                # all rows of the same ocid are in the same bucket
+                assert buckets.setdefault(row["ocid"], bucket) == bucket
+        assert total == sum(len(flat.get(name, [])) for _count, flat in flattener.flatten(releases))
+    assert len(set(buckets.values())) > 1
+
+
+def test_sqlite_writer(spec_analyzed, releases, flatten_options, tmpdir):
+    flattener = Flattener(flatten_options, spec_analyzed.tables)
+    workdir = Path(tmpdir)
+    with SQLiteWriter(workdir, flattener.tables, flattener.options, commit_rows=2) as writer:
+        for _count, flat in flattener.flatten(releases):
+            for name, rows in flat.items():
+                writer.writerows(name, rows)
+        writer.writerow("tenders", {"/test/test": "test"})
+    expected = defaultdict(list)
+    for _count, flat in flattener.flatten(releases):
+        for name, rows in flat.items():
+            expected[name].extend(rows)
+    assert writer.rows == sum(len(rows) for rows in expected.values())
+
+    connection = sqlite3.connect(workdir / "result.sqlite")
+    connection.row_factory = sqlite3.Row
+    for name, rows in expected.items():
+        result = [dict(row) for row in connection.execute(f'SELECT * FROM "{name}"')]
+        assert [{k: v for k, v in row.items() if v is not None} for row in result] == [
+            {k: float(v) if isinstance(v, Decimal) else v for k, v in row.items()} for row in rows
+        ]
+    columns = {row["name"]: row["type"] for row in connection.execute('PRAGMA table_info("tenders")')}
+    assert columns["rowID"] == "TEXT"
+    assert columns["/tender/value/amount"] == "REAL"
+    indexes = {row["name"] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"tenders_rowID", "tenders_parentID", "tenders_ocid", "parties_ocid"} <= indexes
+    connection.close()
+
+
+def test_parquet_writer(spec_analyzed, releases, flatten_options, tmpdir):
+    pyarrow = pytest.importorskip("pyarrow")
+    from pyarrow import parquet
+
+    from spoonbill.writers.parquet import ParquetWriter
+
+    flattener = Flattener(flatten_options, spec_analyzed.tables)
+    workdir = Path(tmpdir)
+    expected = defaultdict(list)
+    with ParquetWriter(workdir, flattener.tables, flattener.options, row_group_size=2) as writer:
+        for _count, flat in flattener.flatten(releases):
+            for name, rows in flat.items():
+                writer.writerows(name, rows)
+                expected[name].extend(rows)
+        writer.writerow("tenders", {"/test/test": "test"})
+
+    tenders = parquet.ParquetFile(workdir / "tenders.parquet")
+    assert tenders.metadata.num_rows == len(expected["tenders"])
+    assert tenders.metadata.num_row_groups == (len(expected["tenders"]) + 1) // 2
+    schema = tenders.schema_arrow
+    assert schema.field("/tender/value/amount").type == pyarrow.float64()
+    assert pyarrow.types.is_dictionary(schema.field("/tender/status").type)
+    rows = tenders.read().to_pylist()
+    for row, source in zip(rows, expected["tenders"]):
+        assert {k: v for k, v in row.items() if v is not None} == {
+            k: float(v) if isinstance(v, Decimal) else v for k, v in source.items()
+        }
+    assert parquet.ParquetFile(workdir / "parties.parquet").metadata.num_rows == len(expected["parties"])
+
+
+def test_file_flattener_parquet_buckets(spec_analyzed, flatten_options, tmpdir):
+    pytest.importorskip("pyarrow")
+    from pyarrow import parquet
+
+    workdir = Path(tmpdir)
+    output = workdir / "parquet"
+    output.mkdir()
+    flattener = FileFlattener(workdir, flatten_options, spec_analyzed.tables, xlsx=None, parquet=output, buckets=3)
+    for _ in flattener.flatten_file(releases_path):
+        pass
+    with open(output / "manifest.json") as fd:
+        manifest = json.load(fd)
+    for name in ("tenders", "parties"):
+        ocids = {}
+        for bucket, count in zip(manifest["buckets"], manifest["tables"][name]):
+            rows = parquet.read_table(output / bucket / f"{name}.parquet").to_pylist()
+            assert len(rows) == count
+            for row in rows:
+                assert ocids.setdefault(row["ocid"], bucket) == bucket
+        assert sum(manifest["tables"][name]) == spec_analyzed.tables[name].total_rows
+
+
+@pytest.mark.parametrize("limits", [{}, {"max_rows": 7}])
+def test_csv_writer_cluster_index(spec, releases, tmpdir, limits):
+    releases[0]["tender"]["items"] = releases[0]["tender"]["items"] * 6
+    for _ in spec.process_items(releases):
+        pass
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}}, "cluster": True})
+    flattener = Flattener(options, spec.tables)
+    workdir = Path(tmpdir)
+    total = defaultdict(int)
+    with CSVWriter(workdir, flattener.tables, flattener.options, max_open=1, **limits) as writer:
+        for _count, flat in flattener.flatten(releases):
+            for name, rows in flat.items():
+                writer.writerows(name, rows)
+                total[name] += len(rows)
+    for name, parent in (("tenders", None), ("tenders_items", "parentID")):
+        with open(workdir / f"{name}.index.jsonl") as fd:
+            entries = [json.loads(line) for line in fd]
+        assert sum(entry["rows"] for entry in entries) == total[name]
+        for entry in entries:
+            path = workdir / entry["file"]
+            with open(path, "rb") as fd:
+                fd.seek(entry["offset"])
+                data = fd.read(entry["bytes"]).decode()
+            headers = read_csv_headers(path)
+            rows = list(csv.DictReader(data.splitlines(), fieldnames=headers))
+            assert len(rows) == entry["rows"]
+            start, end = entry["start"], entry["start"] + entry["rows"]
+            assert rows == read_csv_rows(path)[start:end]
+            for row in rows:
+                assert row["ocid"] == entry["ocid"]
+                assert row["id"] == entry["id"]
+                if parent:
+                    assert row[parent] == entry[parent]
+
+
+def test_csv_writer_cluster_index_releases(spec, releases, tmpdir):
+    releases[0]["tender"]["items"] = releases[0]["tender"]["items"] * 6
+    # two releases of the same ocid with the same tender
+    second = deepcopy(releases[0])
+    second["id"] = f"{second['id']}-update"
+    releases.append(second)
+    for _ in spec.process_items(releases):
+        pass
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}}, "cluster": True})
+    flattener = Flattener(options, spec.tables)
+    workdir = Path(tmpdir)
+    with CSVWriter(workdir, flattener.tables, flattener.options) as writer:
+        for _count, flat in flattener.flatten(releases):
+            for name, rows in flat.items():
+                writer.writerows(name, rows)
+    with open(workdir / "tenders_items.index.jsonl") as fd:
+        entries = [json.loads(line) for line in fd]
+    keys = [(entry["ocid"], entry["id"], entry["parentID"]) for entry in entries]
+    assert len(keys) == len(set(keys))
+    tender_id = releases[0]["tender"]["id"]
+    shared = [entry for entry in entries if entry["ocid"] == second["ocid"] and entry["parentID"] == tender_id]
+    assert [entry["id"] for entry in shared] == [releases[0]["id"], second["id"]]
+
+
+def test_column_stats_writer(spec_analyzed, releases, flatten_options, tmpdir):
+    flattener = Flattener(flatten_options, spec_analyzed.tables)
+    workdir = Path(tmpdir)
+    all_rows = defaultdict(list)
+    with ColumnStatsWriter(workdir, flattener.tables, flattener.options) as writer:
+        for _count, flat in flattener.flatten(releases):
+            for name, rows in flat.items():
+                writer.writerows(name, rows)
+                all_rows[name].extend(rows)
+        # rows dropped by other writers are not counted
+        writer.writerow("tenders", {"/test/test": "test"})
+    with open(workdir / "stats.json") as fd:
+        stats = json.load(fd)["tables"]
+    tenders = stats["tenders"]
+    assert tenders["rows"] == len(all_rows["tenders"])
+    ids = [row.get("/tender/id") for row in all_rows["tenders"]]
+    column = tenders["columns"]["/tender/id"]
+    assert column["nulls"] == ids.count(None)
+    assert column["distinct"] == len(set(ids) - {None})
+    assert column["min"] == min(filter(None, ids))
+    assert column["max_length"] == max(map(len, filter(None, ids)))
+    amounts = [row["/tender/value/amount"] for row in all_rows["tenders"] if "/tender/value/amount" in row]
+    column = tenders["columns"]["/tender/value/amount"]
+    assert column["max"] == float(max(amounts))
+    assert column["nulls"] == tenders["rows"] - len(amounts)
+
+
+def test_column_stats_merge():
+    first, second, both = ColumnStats(), ColumnStats(), ColumnStats()
+    for value in range(100):
+        (first if value % 2 else second).add(value)
+        both.add(value)
+    first.merge(second)
+    assert first.as_dict(100) == both.as_dict(100)
+    stats = both.as_dict(100)
+    assert abs(stats.pop("distinct") - 100) <= 2
+    assert stats == {"nulls": 0, "min": 0, "max": 99, "max_length": 0}
+
+
+def test_fan_out_flattener(spec_analyzed, tmpdir):
+    configs = [
+        ({"tenders": {"split": True}, "parties": {"split": False}}, "en"),
+        ({"tenders": {"split": True, "pretty_headers": True}, "parties": {"split": False}}, "es"),
+        ({"tenders": {"split": False, "only": ["/tender/id"]}}, "en"),
+    ]
+    expected = {}
+    fan_out = []
+    for index, (selection, language) in enumerate(configs):
+        for mode in ("single", "fan_out"):
+            workdir = Path(tmpdir) / mode / str(index)
+            workdir.mkdir(parents=True)
+            options = FlattenOptions(**{"selection": selection})
+            flattener = FileFlattener(
+                workdir, options, spec_analyzed.tables, csv=workdir, xlsx="result.xlsx", language=language
+            )
+            if mode == "single":
+                for _ in flattener.flatten_file(releases_path):
+                    pass
+                expected[index] = {path.name: path.read_bytes() for path in workdir.glob("*.csv")}
+            else:
+                fan_out.append(flattener)
+    flattener = FanOutFlattener(tmpdir, fan_out)
+    assert len(flattener.groups) == 2
+    with patch("spoonbill.iter_file", side_effect=iter_file) as reader:
+        assert list(flattener.flatten_file(releases_path)) == list(range(6))
+    assert reader.call_count == 1
+    for index, fan_out_flattener in enumerate(fan_out):
+        assert {path.name: path.read_bytes() for path in fan_out_flattener.csv.glob("*.csv")} == expected[index]
+        assert (fan_out_flattener.workdir / "result.xlsx").exists()
+
+
+def test_file_flattener_in_memory(spec_analyzed, tmpdir):
+    options = FlattenOptions(**{"selection": {"tenders": {"split": True}, "parties": {"split": False}}})
+    disk = Path(tmpdir) / "disk"
+    disk.mkdir()
+    flattener = FileFlattener(disk, options, spec_analyzed.tables, csv=disk, xlsx="result.xlsx", column_stats=True)
+    for _ in flattener.flatten_file(releases_path):
+        pass
+    memory = Path(tmpdir) / "memory"
+    memory.mkdir()
+    flattener = FileFlattener(
+        memory, options, spec_analyzed.tables, csv=True, xlsx="result.xlsx", column_stats=True, in_memory=True
+    )
+    for _ in flattener.flatten_file(releases_path):
+        pass
+    assert list(memory.iterdir()) == []
+    assert sorted(flattener.results) == ["parties.csv", "result.xlsx", "stats.json", "tenders.csv"]
+    for name in ("parties.csv", "stats.json", "tenders.csv"):
+        assert flattener.results[name].getvalue() == (disk / name).read_bytes()
+    workbook = openpyxl.load_workbook(flattener.results["result.xlsx"])
+    expected = openpyxl.load_workbook(disk / "result.xlsx")
+    assert workbook.sheetnames == expected.sheetnames
+    for sheet in expected.sheetnames:
+        assert list(workbook[sheet].values) == list(expected[sheet].values)
+    with pytest.raises(ValueError):
+        FileFlattener(memory, options, spec_analyzed.tables, csv=True, sqlite="result.sqlite", in_memory=True)
+
+
+def test_csv_writer_streams(spec, tmpdir, flatten_options):
+    tables = prepare_tables(spec, flatten_options, ID_FIELDS)
+    streams = defaultdict(io.BytesIO)
+    with CSVWriter(
+        Path(tmpdir), tables, flatten_options, max_open=1, compression="gzip", open_stream=streams.__getitem__
+    ) as writer:
+        writer.writerow("tenders", {"/tender/id": "1"})
+        writer.writerow("parties", {"/parties/id": "2"})
+        writer.writerow("tenders", {"/tender/id": "3"})
+    assert list(Path(tmpdir).iterdir()) == []
+    assert gzip.decompress(streams["tenders.csv.gz"].getvalue()).decode().splitlines() == ["/tender/id", "1", "3"]
+    assert not streams["tenders.csv.gz"].closed
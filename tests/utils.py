@@ -1,4 +1,5 @@
 import csv
+import json
 
 import openpyxl
 
@@ -29,3 +30,22 @@ def prepare_tables(spec, options, inc_columns=None):
         for name, table in tables.items():
             table.inc_column(inc_columns[name], inc_columns[name])
     return tables
+
+
+def read_csv_rows(path):
+    with open(path) as fd:
+        return list(csv.DictReader(fd))
+
+
+def write_record_package(path, releases):
+    """Write record package with a record per ocid, using the last release as compiled one"""
+    records = {}
+    for release in releases:
+        records[release["ocid"]] = {
+            "ocid": release["ocid"],
+            "releases": releases,
+            "compiledRelease": release,
+            "versionedRelease": {"ocid": release["ocid"]},
+        }
+    with open(path, "w") as fd:
+        json.dump({"uri": "test", "records": list(records.values())}, fd)